@@ -140,6 +140,10 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "users.User"
 
+AUTHENTICATION_BACKENDS = ["users.backends.CachedPermissionBackend"]
+# Время жизни набора прав пользователя в кэше (сек.), сбрасывается сигналами
+PERMISSIONS_CACHE_TIMEOUT = int(os.getenv("PERMISSIONS_CACHE_TIMEOUT") or 24 * 60 * 60)
+
 LOGIN_REDIRECT_URL = "/"
 
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
@@ -152,6 +156,64 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL")
 SERVER_EMAIL = os.getenv("SERVER_EMAIL")
 
+# Настройки отправки рассылок
+# Сколько писем отправлять через одно SMTP-соединение до переподключения
+MAILING_MAX_MESSAGES_PER_CONNECTION = int(
+    os.getenv("MAILING_MAX_MESSAGES_PER_CONNECTION") or 100
+)
+# Размер пачки получателей, обрабатываемой за один проход
+MAILING_SEND_BATCH_SIZE = int(os.getenv("MAILING_SEND_BATCH_SIZE") or 500)
+# Попытки рассылки пишутся в БД пачками: по размеру буфера или по времени (сек.)
+MAILING_ATTEMPT_BATCH_SIZE = int(os.getenv("MAILING_ATTEMPT_BATCH_SIZE") or 500)
+MAILING_ATTEMPT_FLUSH_INTERVAL = float(os.getenv("MAILING_ATTEMPT_FLUSH_INTERVAL") or 5)
+# Повторные попытки для получателей с временной ошибкой (4xx, сбой сети):
+# задержка растет экспоненциально от RETRY_DELAY до RETRY_MAX_DELAY (сек.)
+MAILING_MAX_DELIVERY_ATTEMPTS = int(os.getenv("MAILING_MAX_DELIVERY_ATTEMPTS") or 5)
+MAILING_RETRY_DELAY = int(os.getenv("MAILING_RETRY_DELAY") or 300)
+MAILING_RETRY_MAX_DELAY = int(os.getenv("MAILING_RETRY_MAX_DELAY") or 6 * 60 * 60)
+# Сколько пачек повторов может выполняться одновременно: повторы получают
+# только потоки, не занятые новыми отправками
+MAILING_RETRY_WORKERS = int(os.getenv("MAILING_RETRY_WORKERS") or 1)
+# Планировщик спит до ближайшего начала/окончания рассылки; пока есть активные
+# рассылки, тик выполняется раз в ACTIVE_TICK_INTERVAL сек., а расписание
+# перечитывается из БД не реже раза в RESYNC_INTERVAL сек.
+MAILING_ACTIVE_TICK_INTERVAL = int(os.getenv("MAILING_ACTIVE_TICK_INTERVAL") or 60)
+MAILING_SCHEDULER_RESYNC_INTERVAL = int(
+    os.getenv("MAILING_SCHEDULER_RESYNC_INTERVAL") or 600
+)
+# Пул потоков отправки: всего и на одну рассылку
+MAILING_MAX_WORKERS = int(os.getenv("MAILING_MAX_WORKERS") or 4)
+MAILING_MAX_WORKERS_PER_MAILING = int(os.getenv("MAILING_MAX_WORKERS_PER_MAILING") or 2)
+# Асинхронная отправка (asyncio + aiosmtplib) вместо пула потоков: письма
+# уходят одновременно через пул из ASYNC_POOL_SIZE постоянных SMTP-соединений
+MAILING_ASYNC_SMTP = os.getenv("MAILING_ASYNC_SMTP") == "True"
+MAILING_ASYNC_POOL_SIZE = int(os.getenv("MAILING_ASYNC_POOL_SIZE") or 50)
+# Время аренды шарда получателей (сек.): после него шард упавшего обработчика
+# снова забирается другими процессами
+MAILING_CLAIM_LEASE = int(os.getenv("MAILING_CLAIM_LEASE") or 600)
+# Ограничение скорости отправки, писем в минуту (0 - без ограничения):
+# на SMTP-сервер EMAIL_HOST и на каждый адрес отправителя. Состояние хранится
+# в Redis, поэтому лимит общий для всех процессов-обработчиков
+MAILING_RATE_LIMITS = {
+    "relay": int(os.getenv("MAILING_RELAY_RATE_LIMIT") or 0),
+    "sender": int(os.getenv("MAILING_SENDER_RATE_LIMIT") or 0),
+}
+# При ответах 4xx скорость снижается вдвое, но не ниже этой доли от лимита,
+# и восстанавливается на RECOVERY_STEP после каждого успешного письма
+MAILING_RATE_MIN_FACTOR = float(os.getenv("MAILING_RATE_MIN_FACTOR") or 0.1)
+MAILING_RATE_RECOVERY_STEP = float(os.getenv("MAILING_RATE_RECOVERY_STEP") or 0.02)
+# Страховочное время жизни статистики главной страницы в кэше (сек.):
+# обычно она сбрасывается сигналами при изменении данных
+MAILING_STATS_CACHE_TIMEOUT = int(os.getenv("MAILING_STATS_CACHE_TIMEOUT") or 60 * 60)
+# Метрики Prometheus: порт экспортера в процессе run_scheduler (0 - выключен)
+# и токен для /metrics веб-приложения (пусто - только для сотрудников)
+MAILING_METRICS_PORT = int(os.getenv("MAILING_METRICS_PORT") or 0)
+MAILING_METRICS_TOKEN = os.getenv("MAILING_METRICS_TOKEN") or ""
+# Срок хранения попыток в MailingAttempt (дней): более старые команда
+# archive_attempts переносит в сжатые CSV-файлы в ARCHIVE_DIR
+MAILING_ATTEMPT_RETENTION_DAYS = int(os.getenv("MAILING_ATTEMPT_RETENTION_DAYS") or 180)
+MAILING_ARCHIVE_DIR = Path(os.getenv("MAILING_ARCHIVE_DIR") or BASE_DIR / "archive")
+
 
 CACHES = {
     "default": {
@@ -1,6 +1,9 @@
 from django.contrib import admin
 
-from .models import Mailing, MailingAttempt, Message, Recipient
+from .models import (Mailing, MailingAttempt, MailingAttemptArchive,
+                     MailingDailyStats, MailingDelivery, MailingStatusChange,
+                     Message, Recipient, Segment)
+from .segments import delete_recipient, delete_recipients
 
 
 @admin.register(Recipient)
@@ -11,6 +14,12 @@ class RecipientAdmin(admin.ModelAdmin):
     search_fields = ("email", "full_name")
     list_filter = ("owner",)
 
+    def delete_model(self, request, obj):
+        delete_recipient(obj)
+
+    def delete_queryset(self, request, queryset):
+        delete_recipients(queryset)
+
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
@@ -27,8 +36,21 @@ class MailingAdmin(admin.ModelAdmin):
 
     list_display = ("id", "status", "first_send_time", "end_time", "owner")
     list_filter = ("status", "owner")
-    # Дополнительно: чтобы видеть, какие получатели привязаны
-    filter_horizontal = ("recipients",)
+    filter_horizontal = ("segments",)
+    # Отдельных получателей может быть много: только id, без списка всех клиентов
+    raw_id_fields = ("recipients",)
+
+
+@admin.register(Segment)
+class SegmentAdmin(admin.ModelAdmin):
+    """Класс регистрации сегментов получателей"""
+
+    list_display = ("name", "size", "owner")
+    search_fields = ("name",)
+    list_filter = ("owner",)
+    # Состав сегмента меняется импортом и на сайте: в форме админки
+    # не загружаем всех участников
+    exclude = ("recipients",)
 
 
 @admin.register(MailingAttempt)
@@ -38,3 +60,45 @@ class MailingAttemptAdmin(admin.ModelAdmin):
     list_display = ("id", "mailing", "attempt_time", "status")
     list_filter = ("status", "mailing")
     readonly_fields = ("attempt_time",)
+
+
+@admin.register(MailingDelivery)
+class MailingDeliveryAdmin(admin.ModelAdmin):
+    """Класс регистрации журнала доставки"""
+
+    list_display = (
+        "id",
+        "mailing",
+        "recipient",
+        "status",
+        "attempts",
+        "next_attempt_time",
+    )
+    list_filter = ("status",)
+    raw_id_fields = ("mailing", "recipient")
+
+
+@admin.register(MailingDailyStats)
+class MailingDailyStatsAdmin(admin.ModelAdmin):
+    """Класс регистрации сводки попыток по дням"""
+
+    list_display = ("mailing", "owner", "date", "sent", "failed")
+    list_filter = ("date",)
+    raw_id_fields = ("mailing", "owner")
+
+
+@admin.register(MailingStatusChange)
+class MailingStatusChangeAdmin(admin.ModelAdmin):
+    """Класс регистрации истории статусов рассылок"""
+
+    list_display = ("mailing", "from_status", "to_status", "changed_at")
+    list_filter = ("to_status",)
+    raw_id_fields = ("mailing",)
+
+
+@admin.register(MailingAttemptArchive)
+class MailingAttemptArchiveAdmin(admin.ModelAdmin):
+    """Класс регистрации архивов попыток"""
+
+    list_display = ("date", "file", "rows", "created_at")
+    readonly_fields = ("created_at",)
@@ -6,4 +6,4 @@ class MailingConfig(AppConfig):
     name = "mailing"
 
     def ready(self):
-        pass
+        from . import signals  # noqa: F401
@@ -0,0 +1,166 @@
+import logging
+import os
+from datetime import UTC, datetime, time, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .exporting import iter_buffered, iter_csv, iter_gzip
+from .models import MailingAttempt, MailingAttemptArchive
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_UNTIL_KEY = "archive:until"
+
+# Колонки файла архива: все поля попытки под именами столбцов БД
+ARCHIVE_COLUMNS = {
+    "pk": "id",
+    "attempt_time": "attempt_time",
+    "mailing_id": "mailing_id",
+    "status": "status",
+    "server_response": "server_response",
+}
+
+
+def archive_value(value):
+    """Значение для файла архива: время - в UTC с микросекундами. Архив -
+    единственная копия удаленных попыток, поэтому точность не теряется"""
+    if isinstance(value, datetime):
+        return value.astimezone(UTC).isoformat()
+    return value
+
+
+def archived_until():
+    """Последний день, попытки которого перенесены в архив (None - архива нет).
+    Показывается на каждой странице отчетов, поэтому хранится в кэше до
+    следующего архивирования"""
+    try:
+        cached = cache.get(ARCHIVED_UNTIL_KEY)
+    except Exception as e:
+        logger.warning(f"Кэш архива попыток недоступен: {e}")
+        cached = None
+    if cached is None:
+        # В кэше кортеж: None означает "архива нет", а не "нет в кэше"
+        cached = (MailingAttemptArchive.objects.aggregate(date=Max("date"))["date"],)
+        try:
+            cache.set(ARCHIVED_UNTIL_KEY, cached, settings.MAILING_STATS_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Кэш архива попыток недоступен: {e}")
+    return cached[0]
+
+
+def archived_days():
+    """Дни, попытки которых перенесены в архив"""
+    return set(MailingAttemptArchive.objects.values_list("date", flat=True))
+
+
+def invalidate_archived_until():
+    try:
+        cache.delete(ARCHIVED_UNTIL_KEY)
+    except Exception as e:
+        logger.warning(f"Не удалось сбросить кэш архива попыток: {e}")
+
+
+def day_start(day):
+    """Начало дня day в текущем часовом поясе - так же дни считает сводка"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class AttemptArchiver:
+    """Переносит попытки старше срока хранения из MailingAttempt в архив.
+
+    Попытки каждого дня пишутся потоком в файл attempts-ГГГГ-ММ-ДД.csv.gz,
+    файл сбрасывается на диск, и только после этого попытки дня удаляются
+    одним DELETE в одной транзакции с записью MailingAttemptArchive. Если
+    процесс упадет раньше, попытки останутся в базе и при следующем запуске
+    файл дня будет записан заново. Сводка MailingDailyStats не меняется:
+    итоги за архивные дни по-прежнему видны в отчетах и статистике."""
+
+    def __init__(self, days=None, directory=None, dry_run=False, progress=None):
+        self.days = (
+            days if days is not None else settings.MAILING_ATTEMPT_RETENTION_DAYS
+        )
+        self.directory = Path(directory or settings.MAILING_ARCHIVE_DIR)
+        self.dry_run = dry_run
+        self.progress = progress
+
+    def cutoff(self):
+        """Первый день, попытки которого остаются в базе"""
+        return timezone.localdate() - timedelta(days=self.days)
+
+    def run(self):
+        """Архивирует все дни до cutoff(), возвращает [(день, попыток)]"""
+        if not self.dry_run:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        archived = []
+        for day in self._days():
+            rows = self.archive_day(day)
+            if rows:
+                archived.append((day, rows))
+                if self.progress:
+                    self.progress(day, rows)
+        return archived
+
+    def _days(self):
+        cutoff = self.cutoff()
+        # Самая старая попытка - по индексу attempt_time_idx
+        first = (
+            MailingAttempt.objects.order_by("attempt_time", "id")
+            .values_list("attempt_time", flat=True)
+            .first()
+        )
+        if first is None:
+            return
+        day = timezone.localdate(first)
+        while day < cutoff:
+            yield day
+            day += timedelta(days=1)
+
+    def archive_day(self, day):
+        """Переносит попытки дня day в файл, возвращает их число"""
+        attempts = MailingAttempt.objects.filter(
+            attempt_time__gte=day_start(day),
+            attempt_time__lt=day_start(day + timedelta(days=1)),
+        )
+        # Граница по pk: в файл и в DELETE попадают одни и те же строки
+        bounds = attempts.aggregate(rows=Count("pk"), last_pk=Max("pk"))
+        if not bounds["rows"] or self.dry_run:
+            return bounds["rows"]
+        attempts = attempts.filter(pk__lte=bounds["last_pk"]).order_by("pk")
+
+        path = self._path(day)
+        partial = path.with_name(path.name + ".part")
+        with open(partial, "wb") as file:
+            for chunk in iter_gzip(
+                iter_buffered(iter_csv(attempts, ARCHIVE_COLUMNS, archive_value))
+            ):
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(partial, path)
+
+        with transaction.atomic():
+            attempts.order_by().delete()
+            MailingAttemptArchive.objects.create(
+                date=day, file=path.name, rows=bounds["rows"]
+            )
+            transaction.on_commit(invalidate_archived_until)
+        logger.info(f"Попытки за {day} перенесены в архив {path}: {bounds['rows']}")
+        return bounds["rows"]
+
+    def _path(self, day):
+        # Повторный архив того же дня (попытки, записанные задним числом)
+        # не затирает уже перенесенный файл
+        archives = MailingAttemptArchive.objects.filter(date=day).count()
+        suffix = f"-{archives + 1}" if archives else ""
+        return self.directory / f"attempts-{day.isoformat()}{suffix}.csv.gz"
+
+
+def archive_attempts(days=None, directory=None, dry_run=False, progress=None):
+    """Переносит попытки старше days дней (MAILING_ATTEMPT_RETENTION_DAYS)
+    в архив, возвращает [(день, попыток)]"""
+    return AttemptArchiver(days, directory, dry_run, progress).run()
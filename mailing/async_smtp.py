@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import smtplib
+
+import aiosmtplib
+from django.conf import settings
+
+from .metrics import SMTP_CONNECTIONS, stage
+from .ratelimit import RateLimiter
+from .smtp import is_throttling
+
+logger = logging.getLogger(__name__)
+
+SMTP_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+
+
+def as_smtplib_error(error):
+    """Ошибка aiosmtplib в виде исключения smtplib: коды ответов дальше
+    разбирают smtp_error_code и is_permanent, общие для обоих способов отправки"""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return smtplib.SMTPRecipientsRefused(
+            {
+                refused.recipient: (refused.code, refused.message)
+                for refused in error.recipients
+            }
+        )
+    if isinstance(error, aiosmtplib.SMTPSenderRefused):
+        return smtplib.SMTPSenderRefused(error.code, error.message, error.sender)
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return smtplib.SMTPResponseException(error.code, error.message)
+    if isinstance(error, aiosmtplib.SMTPServerDisconnected):
+        return smtplib.SMTPServerDisconnected(str(error))
+    return error
+
+
+def _client():
+    """Клиент aiosmtplib с настройками EMAIL_* как у SMTP-бэкенда Django"""
+    options = {}
+    if settings.EMAIL_HOST_USER and settings.EMAIL_HOST_PASSWORD:
+        options["username"] = settings.EMAIL_HOST_USER
+        options["password"] = settings.EMAIL_HOST_PASSWORD
+    # Без EMAIL_TIMEOUT остается таймаут aiosmtplib по умолчанию: зависшее
+    # соединение не должно держать слот пула вечно
+    if settings.EMAIL_TIMEOUT:
+        options["timeout"] = settings.EMAIL_TIMEOUT
+    return aiosmtplib.SMTP(
+        hostname=settings.EMAIL_HOST,
+        port=int(settings.EMAIL_PORT) if settings.EMAIL_PORT else None,
+        use_tls=bool(settings.EMAIL_USE_SSL),
+        start_tls=bool(settings.EMAIL_USE_TLS),
+        client_cert=settings.EMAIL_SSL_CERTFILE,
+        client_key=settings.EMAIL_SSL_KEYFILE,
+        **options,
+    )
+
+
+class AsyncSmtpPool:
+    """Пул постоянных SMTP-соединений для отправки из цикла событий asyncio.
+
+    Одновременно отправляется не больше size писем - по одному на соединение,
+    остальные ждут свободного соединения. Соединения открываются по мере
+    надобности и переиспользуются, переоткрываются после
+    MAILING_MAX_MESSAGES_PER_CONNECTION писем и при обрыве связи сервером.
+    Ошибки отправки возвращаются в виде исключений smtplib, как у SmtpSession."""
+
+    def __init__(self, size=None, max_messages=None):
+        self.size = size or settings.MAILING_ASYNC_POOL_SIZE
+        self.max_messages = max_messages or settings.MAILING_MAX_MESSAGES_PER_CONNECTION
+        self.limiter = RateLimiter()
+        self._slots = asyncio.Semaphore(self.size)
+        self._idle = []
+        self._sent = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._close(client) for client in idle))
+
+    async def _connect(self):
+        client = _client()
+        with stage("smtp_connect"):
+            await client.connect()
+        SMTP_CONNECTIONS.inc()
+        self._sent[client] = 0
+        return client
+
+    async def _close(self, client):
+        self._sent.pop(client, None)
+        try:
+            await client.quit()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии SMTP-соединения: {e}")
+            client.close()
+
+    async def _deliver(self, client, email_message):
+        with stage("smtp_send"):
+            await client.sendmail(
+                email_message.envelope_from,
+                email_message.envelope_to,
+                email_message.data,
+            )
+        self._sent[client] += 1
+
+    async def _send(self, email_message):
+        """Отправка PreparedEmail через свободное соединение пула"""
+        async with self._slots:
+            client = self._idle.pop() if self._idle else await self._connect()
+            try:
+                try:
+                    await self._deliver(client, email_message)
+                except (aiosmtplib.SMTPServerDisconnected, ConnectionError) as e:
+                    # Сервер закрыл соединение - переподключаемся и повторяем один раз
+                    logger.warning(
+                        f"SMTP-соединение разорвано ({e}), переподключение..."
+                    )
+                    self._sent.pop(client, None)
+                    client.close()
+                    client = await self._connect()
+                    await self._deliver(client, email_message)
+            except BaseException:
+                # Соединение после ошибки может быть в неизвестном состоянии
+                if (
+                    client.is_connected
+                    and self._sent.get(client, 0) < self.max_messages
+                ):
+                    self._idle.append(client)
+                else:
+                    await self._close(client)
+                raise
+
+            if self._sent[client] < self.max_messages:
+                self._idle.append(client)
+            else:
+                await self._close(client)
+
+    async def send(self, email_message):
+        """Отправляет одно письмо (PreparedEmail)"""
+        sender = email_message.from_email
+        if self.limiter.enabled:
+            # Ограничитель синхронный (Redis, ожидание токена) - не блокируем цикл
+            await asyncio.to_thread(self.limiter.acquire, sender)
+        try:
+            await self._send(email_message)
+        except aiosmtplib.SMTPException as e:
+            error = as_smtplib_error(e)
+            if is_throttling(error):
+                logger.warning(
+                    f"Сервер ограничивает отправку ({error}), снижаем скорость"
+                )
+                if self.limiter.enabled:
+                    await asyncio.to_thread(self.limiter.throttled, sender)
+            raise error from e
+
+        if self.limiter.enabled:
+            await asyncio.to_thread(self.limiter.succeeded, sender)
+
+    async def send_batch(self, email_messages):
+        """Отправляет пачку писем одновременно, возвращает список ошибок
+        (None - успех) в порядке писем"""
+        results = await asyncio.gather(
+            *(self.send(email_message) for email_message in email_messages),
+            return_exceptions=True,
+        )
+        return [
+            result if isinstance(result, BaseException) else None for result in results
+        ]
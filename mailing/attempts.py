@@ -0,0 +1,81 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .delivery import record_outcomes
+from .metrics import ATTEMPTS_PERSISTED, stage
+from .models import MailingAttempt
+from .retry import is_permanent
+from .rollups import record_attempts
+from .stats import invalidate_stats
+
+logger = logging.getLogger(__name__)
+
+
+class AttemptWriter:
+    """Буферизует попытки рассылки и записывает их пачками через bulk_create.
+
+    Буфер сбрасывается при достижении MAILING_ATTEMPT_BATCH_SIZE записей или
+    по истечении MAILING_ATTEMPT_FLUSH_INTERVAL секунд, а также при выходе из
+    контекстного менеджера (в том числе по исключению). Вместе с попытками
+    в той же транзакции обновляются сводка по дням и журнал доставки."""
+
+    def __init__(self, batch_size=None, flush_interval=None):
+        self.batch_size = batch_size or settings.MAILING_ATTEMPT_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.MAILING_ATTEMPT_FLUSH_INTERVAL
+        self._buffer = []
+        self._delivered = []
+        self._failed = []
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def add(self, mailing, status, server_response, delivery=None, permanent=False):
+        self._buffer.append(
+            MailingAttempt(
+                mailing=mailing, status=status, server_response=server_response
+            )
+        )
+        if delivery is not None:
+            if status == "Успешно":
+                self._delivered.append(delivery)
+            else:
+                self._failed.append((delivery, server_response, permanent))
+        if (
+            len(self._buffer) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def success(self, mailing, delivery=None, server_response="Письмо отправлено"):
+        self.add(mailing, "Успешно", server_response, delivery)
+
+    def failure(self, mailing, error, delivery=None):
+        self.add(mailing, "Не успешно", str(error), delivery, is_permanent(error))
+
+    def flush(self):
+        """Записывает накопленные попытки одной транзакцией"""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+
+        buffer, self._buffer = self._buffer, []
+        delivered, self._delivered = self._delivered, []
+        failed, self._failed = self._failed, []
+        try:
+            with stage("attempt_persist"), transaction.atomic():
+                MailingAttempt.objects.bulk_create(buffer, batch_size=self.batch_size)
+                record_attempts(buffer)
+                record_outcomes(delivered, failed)
+                owner_ids = {attempt.mailing.owner_id for attempt in buffer}
+                transaction.on_commit(lambda: invalidate_stats(owner_ids))
+        except Exception as e:
+            logger.error(f"Не удалось записать {len(buffer)} попыток рассылки: {e}")
+            raise
+        ATTEMPTS_PERSISTED.inc(len(buffer))
@@ -0,0 +1,352 @@
+import json
+import math
+import random
+import resource
+import socketserver
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from .async_smtp import AsyncSmtpPool
+from .models import Mailing, Message, Recipient, Segment
+from .segments import refresh_sizes
+from .services import process_mailings, send_mailing
+from .smtp import SmtpSession
+
+# Признаки тестовых данных бенчмарка, по ним они удаляются после запуска
+BENCHMARK_EMAIL_PREFIX = "benchmark-"
+BENCHMARK_SUBJECT = "[benchmark] Тестовая рассылка"
+
+# Для каких метрик рост - это ухудшение (для остальных - улучшение)
+LOWER_IS_BETTER = {
+    "latency_p50_ms": True,
+    "latency_p99_ms": True,
+    "queries_per_email": True,
+    "peak_rss_mb": True,
+    "emails_per_second": False,
+}
+
+
+class BenchmarkError(Exception):
+    """Бенчмарк нельзя запустить на этой базе"""
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    """Минимальный SMTP-сервер: принимает письма и никуда их не отправляет"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        sink = self.server
+        self.reply("220 benchmark sink")
+        while line := self.rfile.readline():
+            command = line[:4].upper()
+            if command == b"EHLO" or command == b"HELO":
+                self.reply("250 benchmark sink")
+            elif command == b"RCPT":
+                if random.random() < sink.failure_rate:
+                    sink.count("rejected")
+                    self.reply(f"{sink.failure_code} benchmark sink: rejected")
+                else:
+                    self.reply("250 OK")
+            elif command == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                if sink.latency:
+                    time.sleep(sink.latency)
+                sink.count("accepted")
+                self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                return
+            elif command in (b"MAIL", b"RSET", b"NOOP"):
+                self.reply("250 OK")
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """Локальная заглушка SMTP-сервера в отдельном потоке.
+
+    latency - задержка ответа на DATA в секундах, failure_rate - доля
+    получателей, которым сервер отказывает кодом failure_code."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    # Очередь подключений как у настоящего сервера: пул асинхронной отправки
+    # открывает десятки соединений одновременно
+    request_queue_size = 256
+
+    def __init__(self, latency=0.0, failure_rate=0.0, failure_code=451):
+        super().__init__(("127.0.0.1", 0), SmtpSinkHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_code = failure_code
+        self.stats = {"accepted": 0, "rejected": 0}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="smtp-sink", daemon=True
+        )
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+
+
+class QueryCounter:
+    """Считает SQL-запросы во всех потоках, включая потоки пула отправки,
+    у каждого из которых свое соединение с БД"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _install(self, db_connection):
+        if self not in db_connection.execute_wrappers:
+            db_connection.execute_wrappers.append(self)
+
+    def _on_connection_created(self, sender, connection, **kwargs):
+        self._install(connection)
+
+    @contextmanager
+    def installed(self):
+        connection_created.connect(self._on_connection_created, weak=False)
+        self._install(connection)
+        try:
+            yield self
+        finally:
+            connection_created.disconnect(self._on_connection_created)
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+@contextmanager
+def measure_send_latency(latencies):
+    """Записывает в latencies длительность каждой отправки письма, в секундах.
+    При асинхронной отправке замеряется обмен с сервером, без ожидания
+    свободного соединения пула"""
+    original_send = SmtpSession.send
+    original_async_deliver = AsyncSmtpPool._deliver
+
+    def timed_send(session, email_message):
+        started = time.perf_counter()
+        try:
+            return original_send(session, email_message)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    async def timed_async_deliver(pool, client, email_message):
+        started = time.perf_counter()
+        try:
+            return await original_async_deliver(pool, client, email_message)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    SmtpSession.send = timed_send
+    AsyncSmtpPool._deliver = timed_async_deliver
+    try:
+        yield latencies
+    finally:
+        SmtpSession.send = original_send
+        AsyncSmtpPool._deliver = original_async_deliver
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def peak_rss_mb():
+    """Пиковый объем резидентной памяти процесса в мегабайтах"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На Linux ru_maxrss в килобайтах, на macOS - в байтах
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def cleanup_benchmark_data():
+    """Удаляет данные прошлых запусков бенчмарка (рассылки удаляются каскадом)"""
+    Message.objects.filter(subject=BENCHMARK_SUBJECT).delete()
+    Segment.objects.filter(name=BENCHMARK_SUBJECT).delete()
+    Recipient.objects.filter(email__startswith=BENCHMARK_EMAIL_PREFIX).delete()
+
+
+def foreign_active_mailings():
+    """Активные рассылки, созданные не бенчмарком: process_mailings отправил
+    бы их вместе с тестовыми"""
+    now = timezone.now()
+    return Mailing.objects.filter(
+        status__in=["Создана", "Запущена"],
+        first_send_time__lte=now,
+        end_time__gte=now,
+    ).exclude(message__subject=BENCHMARK_SUBJECT)
+
+
+def seed_benchmark_data(recipients, mailings, body_size=2000):
+    """Создает recipients получателей, сегмент из всех получателей
+    и mailings активных рассылок этого сегмента"""
+    cleanup_benchmark_data()
+    recipient_objects = Recipient.objects.bulk_create(
+        [
+            Recipient(
+                email=f"{BENCHMARK_EMAIL_PREFIX}{i}@example.com",
+                full_name=f"Получатель {i}",
+            )
+            for i in range(recipients)
+        ],
+        batch_size=1000,
+    )
+    message = Message.objects.create(
+        subject=BENCHMARK_SUBJECT,
+        body=("Текст тестового письма рассылки. " * body_size)[:body_size],
+    )
+
+    segment = Segment.objects.create(name=BENCHMARK_SUBJECT)
+    through = Segment.recipients.through
+    through.objects.bulk_create(
+        [
+            through(segment=segment, recipient=recipient)
+            for recipient in recipient_objects
+        ],
+        batch_size=1000,
+    )
+    refresh_sizes([segment.pk])
+
+    now = timezone.now()
+    for _ in range(mailings):
+        mailing = Mailing.objects.create(
+            first_send_time=now - timedelta(minutes=1),
+            end_time=now + timedelta(days=1),
+            message=message,
+        )
+        mailing.segments.add(segment)
+
+
+def run_send_benchmark(
+    recipients,
+    mailings,
+    mode="process",
+    latency=0.0,
+    failure_rate=0.0,
+    max_workers=None,
+    per_mailing=None,
+    body_size=2000,
+):
+    """Отправляет тестовые рассылки на локальную заглушку SMTP и возвращает
+    метрики: письма в секунду, p50/p99 длительности отправки одного письма,
+    SQL-запросы на письмо и пиковую память процесса.
+
+    mode="process" - все рассылки через process_mailings (пул потоков),
+    mode="async" - через process_mailings с асинхронной отправкой
+    (max_workers - размер пула SMTP-соединений),
+    mode="send" - по одной через send_mailing.
+
+    process_mailings обрабатывает все активные рассылки базы, поэтому в
+    режимах process и async бенчмарк отказывается запускаться (BenchmarkError),
+    если в базе есть активные рассылки, кроме тестовых."""
+    if mode != "send":
+        foreign = foreign_active_mailings().count()
+        if foreign:
+            raise BenchmarkError(
+                f"Активных рассылок в базе, кроме тестовых: {foreign}. Режим "
+                f"{mode} отправил бы и их - запустите бенчмарк на пустой базе "
+                "или в режиме send"
+            )
+    seed_benchmark_data(recipients, mailings, body_size)
+    latencies = []
+    counter = QueryCounter()
+
+    with SmtpSink(latency, failure_rate) as sink, override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+        EMAIL_HOST="127.0.0.1",
+        EMAIL_PORT=sink.port,
+        EMAIL_USE_TLS=False,
+        EMAIL_USE_SSL=False,
+        EMAIL_HOST_USER="benchmark@example.com",
+        EMAIL_HOST_PASSWORD="",
+        MAILING_RATE_LIMITS={"relay": 0, "sender": 0},
+    ):
+        try:
+            with counter.installed(), measure_send_latency(latencies):
+                started = time.perf_counter()
+                if mode == "send":
+                    for mailing in Mailing.objects.filter(
+                        message__subject=BENCHMARK_SUBJECT
+                    ).select_related("message"):
+                        send_mailing(mailing)
+                elif mode == "async":
+                    process_mailings(
+                        per_mailing=per_mailing, use_async=True, connections=max_workers
+                    )
+                else:
+                    process_mailings(max_workers, per_mailing, use_async=False)
+                elapsed = time.perf_counter() - started
+        finally:
+            cleanup_benchmark_data()
+
+    emails = len(latencies)
+    return {
+        "emails": emails,
+        "accepted": sink.stats["accepted"],
+        "rejected": sink.stats["rejected"],
+        "seconds": round(elapsed, 3),
+        "emails_per_second": round(emails / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "queries_per_email": round(counter.count / emails, 3) if emails else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def save_baseline(path, result, params):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "result": result}, f, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_with_baseline(result, baseline):
+    """Сравнивает метрики с сохраненными. Возвращает список
+    (метрика, было, стало, изменение в %, ухудшение в %)"""
+    rows = []
+    for metric, lower_is_better in LOWER_IS_BETTER.items():
+        before = baseline["result"].get(metric)
+        after = result.get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before * 100
+        regression = change if lower_is_better else -change
+        rows.append((metric, before, after, change, max(0.0, regression)))
+    return rows
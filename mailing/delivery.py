@@ -0,0 +1,236 @@
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .metrics import stage
+from .models import Mailing, MailingDelivery, Recipient, Segment
+from .retry import retry_delay
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор процесса-обработчика, которому выдаются шарды получателей
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def audience_filter(mailing, field="pk"):
+    """Условие "получатель входит в аудиторию рассылки" для поля field с id
+    получателя: отдельные получатели рассылки и участники ее сегментов.
+    Подзапросы по промежуточным таблицам не размножают строки, как JOIN"""
+    direct = Mailing.recipients.through.objects.filter(mailing=mailing)
+    members = Segment.recipients.through.objects.filter(segment__mailings=mailing)
+    return Q(**{f"{field}__in": direct.values("recipient_id")}) | Q(
+        **{f"{field}__in": members.values("recipient_id")}
+    )
+
+
+def audience(mailing):
+    """Получатели рассылки без повторов"""
+    return Recipient.objects.filter(audience_filter(mailing))
+
+
+def iter_missing_recipient_ids(mailing, chunk_size=None):
+    """Потоково отдает порциями id получателей рассылки, у которых еще нет
+    записи в журнале доставки: сначала отдельных получателей, затем
+    участников каждого сегмента. Отсев уже заведенных - NOT EXISTS по
+    уникальному индексу журнала (mailing_id, recipient_id), постраничность по
+    ключу (recipient_id > последнего) - по уникальным индексам промежуточных
+    таблиц (mailing_id, recipient_id) и (segment_id, recipient_id), без
+    открытого курсора между порциями. Получатель, входящий в несколько
+    сегментов, может встретиться несколько раз."""
+    chunk_size = chunk_size or settings.MAILING_SEND_BATCH_SIZE
+    sources = [Mailing.recipients.through.objects.filter(mailing=mailing)]
+    members = Segment.recipients.through.objects
+    for segment_id in mailing.segments.values_list("pk", flat=True):
+        sources.append(members.filter(segment_id=segment_id))
+    delivered = MailingDelivery.objects.filter(
+        mailing=mailing, recipient_id=OuterRef("recipient_id")
+    )
+
+    for links in sources:
+        links = links.filter(~Exists(delivered))
+        last_id = 0
+        while True:
+            chunk = list(
+                links.filter(recipient_id__gt=last_id)
+                .order_by("recipient_id")
+                .values_list("recipient_id", flat=True)[:chunk_size]
+            )
+            if not chunk:
+                break
+            yield chunk
+            last_id = chunk[-1]
+
+
+@stage("delivery_sync")
+def sync_deliveries(mailing):
+    """Заводит записи журнала доставки для получателей, добавленных в рассылку
+    или в ее сегменты. Выбираются только получатели без записи (anti-join),
+    поэтому замена получателя или участника сегмента не теряется, а
+    неизменная аудитория стоит одного прохода по индексам без вставок.
+    Повторы между сегментами отсекает уникальный индекс журнала"""
+    for batch in iter_missing_recipient_ids(mailing):
+        MailingDelivery.objects.bulk_create(
+            [
+                MailingDelivery(mailing=mailing, recipient_id=recipient_id)
+                for recipient_id in batch
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def pending_deliveries(mailing, now=None, retries=False):
+    """Получатели рассылки, которым еще нужно отправить письмо: новые или
+    (retries=True) те, у кого подошло время повторной попытки. Получатели,
+    уже забранные другим обработчиком, пропускаются до истечения аренды."""
+    now = now or timezone.now()
+    if retries:
+        status_filter = Q(status="Ошибка", next_attempt_time__lte=now)
+    else:
+        status_filter = Q(status="Ожидает")
+    return (
+        MailingDelivery.objects.filter(mailing=mailing)
+        .filter(audience_filter(mailing, "recipient_id"))
+        .filter(status_filter)
+        .filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now))
+    )
+
+
+@stage("recipient_fetch")
+def claim_deliveries(mailing, limit, after_pk=0, retries=False, now=None):
+    """Забирает в аренду шард из не более чем limit ожидающих получателей.
+
+    Строки выбираются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+    несколько обработчиков никогда не получат одного и того же получателя.
+    Если обработчик упадет, по истечении MAILING_CLAIM_LEASE секунд шард
+    снова станет доступен. Возвращает легкие записи
+    (pk, attempts, email, full_name) без создания экземпляров моделей."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        shard = list(
+            pending_deliveries(mailing, now, retries)
+            .filter(pk__gt=after_pk)
+            .select_for_update(skip_locked=True, of=("self",))
+            .annotate(email=F("recipient__email"), full_name=F("recipient__full_name"))
+            .order_by("pk")
+            .values_list("pk", "attempts", "email", "full_name", named=True)[:limit]
+        )
+        if shard:
+            MailingDelivery.objects.filter(pk__in=[row.pk for row in shard]).update(
+                claimed_by=WORKER_ID,
+                lease_expires_at=now + timedelta(seconds=settings.MAILING_CLAIM_LEASE),
+            )
+    return shard
+
+
+def renew_leases(pks, now=None):
+    """Продлевает на MAILING_CLAIM_LEASE аренду получателей pks, которые еще
+    числятся за этим обработчиком. Записанные результаты (record_outcomes
+    снимает аренду) и получатели, перехваченные другим обработчиком после
+    истечения аренды, не затрагиваются"""
+    now = now or timezone.now()
+    return MailingDelivery.objects.filter(pk__in=pks, claimed_by=WORKER_ID).update(
+        lease_expires_at=now + timedelta(seconds=settings.MAILING_CLAIM_LEASE)
+    )
+
+
+class LeaseKeeper:
+    """Продлевает аренду шарда, пока он отправляется.
+
+    При ограничении скорости (RateLimiter) пачка может отправляться дольше
+    MAILING_CLAIM_LEASE, а результаты пишутся только после всей пачки. Без
+    продления аренда истечет посреди отправки, и получателей заберет и
+    отправит повторно другой обработчик или ручная отправка. keep_alive()
+    вызывается после каждого письма и продлевает аренду раз в треть ее
+    срока."""
+
+    def __init__(self, rows):
+        self.pks = [row.pk for row in rows]
+        self.interval = settings.MAILING_CLAIM_LEASE / 3
+        self._renewed = time.monotonic()
+
+    def keep_alive(self):
+        if time.monotonic() - self._renewed >= self.interval:
+            self.renew()
+
+    def renew(self):
+        self._renewed = time.monotonic()
+        try:
+            renew_leases(self.pks)
+        except Exception as e:
+            # Отправку не прерываем: в худшем случае аренда истечет, как раньше
+            logger.warning(f"Не удалось продлить аренду получателей: {e}")
+
+
+def iter_claimed_deliveries(mailing, chunk_size=None, retries=False):
+    """Потоково забирает шарды получателей рассылки, пока они есть.
+    Каждый следующий шард берется по ключу pk > последнего, поэтому за один
+    проход получатель обрабатывается не больше одного раза, а память не
+    растет с размером рассылки."""
+    chunk_size = chunk_size or settings.MAILING_SEND_BATCH_SIZE
+    last_pk = 0
+    while shard := claim_deliveries(mailing, chunk_size, last_pk, retries):
+        yield shard
+        last_pk = shard[-1].pk
+
+
+def record_outcomes(delivered, failed, now=None):
+    """Обновляет журнал доставки по результатам отправки.
+
+    delivered - строки из claim_deliveries, failed - тройки
+    (строка, ошибка, постоянный ли отказ). Временные отказы получают время
+    следующей попытки с экспоненциальной задержкой, постоянные отказы и
+    исчерпавшие MAILING_MAX_DELIVERY_ATTEMPTS попыток отклоняются.
+    Аренда обработанных получателей снимается."""
+    now = now or timezone.now()
+
+    if delivered:
+        MailingDelivery.objects.filter(pk__in=[row.pk for row in delivered]).update(
+            status="Доставлено",
+            attempts=F("attempts") + 1,
+            last_attempt_time=now,
+            next_attempt_time=None,
+            last_error=None,
+            claimed_by=None,
+            lease_expires_at=None,
+        )
+
+    if failed:
+        updates = []
+        for row, error, permanent in failed:
+            attempts = row.attempts + 1
+            can_retry = (
+                not permanent and attempts < settings.MAILING_MAX_DELIVERY_ATTEMPTS
+            )
+            updates.append(
+                MailingDelivery(
+                    pk=row.pk,
+                    status="Ошибка" if can_retry else "Отклонено",
+                    attempts=attempts,
+                    last_attempt_time=now,
+                    next_attempt_time=(
+                        now + retry_delay(attempts) if can_retry else None
+                    ),
+                    last_error=error,
+                    claimed_by=None,
+                    lease_expires_at=None,
+                )
+            )
+        MailingDelivery.objects.bulk_update(
+            updates,
+            [
+                "status",
+                "attempts",
+                "last_attempt_time",
+                "next_attempt_time",
+                "last_error",
+                "claimed_by",
+                "lease_expires_at",
+            ],
+        )
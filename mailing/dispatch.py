@@ -0,0 +1,226 @@
+import asyncio
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connection, connections
+
+from .async_smtp import AsyncSmtpPool
+from .attempts import AttemptWriter
+from .delivery import LeaseKeeper, iter_claimed_deliveries, sync_deliveries
+from .metrics import EMAILS, stage
+from .rendering import PreparedMessage
+from .smtp import SmtpSession
+
+logger = logging.getLogger(__name__)
+
+
+def send_batch(mailing, prepared, batch, session, writer):
+    """Отправляет пачку получателей через открытую SMTP-сессию и фиксирует результаты.
+    prepared - PreparedMessage, собранный один раз на запуск рассылки.
+    Пока пачка отправляется, аренда ее получателей продлевается"""
+    emails = [prepared.render(recipient.email, recipient) for recipient in batch]
+    errors = session.send_batch(emails, progress=LeaseKeeper(batch).keep_alive)
+    record_results(mailing, batch, errors, writer)
+
+
+def record_results(mailing, batch, errors, writer):
+    """Фиксирует результаты отправки пачки (ошибка или None для каждого получателя)"""
+    for recipient, error in zip(batch, errors):
+        if error is None:
+            EMAILS.labels("sent").inc()
+            writer.success(mailing, delivery=recipient)
+            logger.info(
+                f"Письмо для {recipient.email} (рассылка {mailing.pk}) отправлено."
+            )
+        else:
+            EMAILS.labels("failed").inc()
+            writer.failure(mailing, error, delivery=recipient)
+            logger.error(
+                f"Ошибка отправки {recipient.email} (рассылка {mailing.pk}): {error}"
+            )
+
+
+def _send_batch_task(mailing, prepared, batch):
+    """Задача пула: своя SMTP-сессия, свой буфер попыток и свое соединение с БД"""
+    try:
+        with SmtpSession() as session, AttemptWriter() as writer:
+            send_batch(mailing, prepared, batch, session, writer)
+        return len(batch)
+    finally:
+        connection.close()
+
+
+class MailingDispatcher:
+    """Параллельно рассылает несколько рассылок ограниченным пулом потоков.
+
+    Получатели каждой рассылки делятся на пачки по MAILING_SEND_BATCH_SIZE.
+    Одновременно выполняется не больше max_workers пачек всего и не больше
+    per_mailing пачек одной рассылки, поэтому большая рассылка или медленный
+    сервер не задерживают остальные. Повторные попытки идут с низшим
+    приоритетом: только в потоки, не занятые новыми отправками, и не больше
+    retry_workers пачек одновременно. sync=False - журнал доставки уже заведен
+    (процессы отправки: его заводит родительский процесс)."""
+
+    def __init__(
+        self, max_workers=None, per_mailing=None, retry_workers=None, sync=True
+    ):
+        self.max_workers = max_workers or settings.MAILING_MAX_WORKERS
+        self.per_mailing = per_mailing or settings.MAILING_MAX_WORKERS_PER_MAILING
+        self.retry_workers = retry_workers or settings.MAILING_RETRY_WORKERS
+        self.sync = sync
+
+    def run(self, mailings):
+        """Возвращает словарь {pk рассылки: число обработанных получателей}"""
+        fresh = {}
+        retries = {}
+        for mailing in mailings:
+            if self.sync:
+                sync_deliveries(mailing)
+            # Сообщение собирается в MIME один раз на рассылку и общее для потоков
+            with stage("message_build"):
+                prepared = PreparedMessage(mailing.message)
+            fresh[mailing.pk] = (mailing, prepared, iter_claimed_deliveries(mailing))
+            retries[mailing.pk] = (
+                mailing,
+                prepared,
+                iter_claimed_deliveries(mailing, retries=True),
+            )
+
+        processed = dict.fromkeys(fresh, 0)
+        running = dict.fromkeys(fresh, 0)
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while True:
+                self._fill(pool, fresh, running, in_flight, retry=False)
+                self._fill(pool, retries, running, in_flight, retry=True)
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pk, _ = in_flight.pop(future)
+                    running[pk] -= 1
+                    try:
+                        processed[pk] += future.result()
+                    except Exception as e:
+                        logger.error(f"Ошибка при отправке пачки рассылки {pk}: {e}")
+
+        return processed
+
+    def _has_slot(self, in_flight, retry):
+        if len(in_flight) >= self.max_workers:
+            return False
+        if retry:
+            retrying = sum(1 for _, is_retry in in_flight.values() if is_retry)
+            return retrying < self.retry_workers
+        return True
+
+    def _fill(self, pool, queues, running, in_flight, retry):
+        """Раздает свободным потокам по одной пачке от каждой рассылки по кругу"""
+        added = True
+        while added and self._has_slot(in_flight, retry):
+            added = False
+            for pk in list(queues):
+                if not self._has_slot(in_flight, retry):
+                    break
+                if running[pk] >= self.per_mailing:
+                    continue
+
+                mailing, prepared, batches = queues[pk]
+                batch = next(batches, None)
+                if batch is None:
+                    del queues[pk]
+                    continue
+
+                future = pool.submit(_send_batch_task, mailing, prepared, batch)
+                in_flight[future] = (pk, retry)
+                running[pk] += 1
+                added = True
+
+
+class AsyncMailingDispatcher:
+    """Рассылает рассылки из цикла событий asyncio через пул SMTP-соединений.
+
+    Письма пачки отправляются одновременно, в полете до pool_size писем на
+    процесс. Журнал доставки и попытки пишутся синхронно в отдельном потоке.
+    Одновременно обрабатывается не больше per_mailing пачек одной рассылки,
+    повторные попытки идут после новых получателей, как в _execute_send.
+    sync - как в MailingDispatcher."""
+
+    def __init__(self, pool_size=None, per_mailing=None, sync=True):
+        self.pool_size = pool_size or settings.MAILING_ASYNC_POOL_SIZE
+        self.per_mailing = per_mailing or settings.MAILING_MAX_WORKERS_PER_MAILING
+        self.sync = sync
+
+    def run(self, mailings):
+        """Возвращает словарь {pk рассылки: число обработанных получателей}"""
+        # ORM синхронный: все запросы идут по очереди в одном отдельном
+        # потоке со своим соединением с БД, цикл событий их только ждет
+        with ThreadPoolExecutor(1, thread_name_prefix="mailing-db") as executor:
+            self._executor = executor
+            return asyncio.run(self._run(mailings))
+
+    async def _db(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _run(self, mailings):
+        writer = AttemptWriter()
+        try:
+            async with AsyncSmtpPool(self.pool_size) as pool:
+                results = await asyncio.gather(
+                    *(
+                        self._send_mailing(mailing, pool, writer)
+                        for mailing in mailings
+                    ),
+                    return_exceptions=True,
+                )
+        finally:
+            await self._db(writer.flush)
+            await self._db(connections.close_all)
+
+        processed = {}
+        for mailing, result in zip(mailings, results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка при отправке рассылки {mailing.pk}: {result}")
+                result = 0
+            processed[mailing.pk] = result
+        return processed
+
+    async def _send_mailing(self, mailing, pool, writer):
+        if self.sync:
+            await self._db(sync_deliveries, mailing)
+        with stage("message_build"):
+            prepared = PreparedMessage(mailing.message)
+
+        processed = 0
+        for retries in (False, True):
+            batches = iter_claimed_deliveries(mailing, retries=retries)
+            workers = 1 if retries else self.per_mailing
+            counts = await asyncio.gather(
+                *(
+                    self._send_batches(mailing, prepared, batches, pool, writer)
+                    for _ in range(workers)
+                )
+            )
+            processed += sum(counts)
+        return processed
+
+    async def _send_batches(self, mailing, prepared, batches, pool, writer):
+        """Забирает пачки из общего итератора рассылки, пока они есть"""
+        processed = 0
+        while batch := await self._db(next, batches, None):
+            emails = [
+                prepared.render(recipient.email, recipient) for recipient in batch
+            ]
+            # Письма пачки уходят одновременно: аренду продлеваем по таймеру
+            lease = LeaseKeeper(batch)
+            sending = asyncio.ensure_future(pool.send_batch(emails))
+            while not (await asyncio.wait({sending}, timeout=lease.interval))[0]:
+                await self._db(lease.renew)
+            errors = sending.result()
+            await self._db(record_results, mailing, batch, errors, writer)
+            processed += len(batch)
+        return processed
@@ -0,0 +1,95 @@
+import csv
+import zlib
+from datetime import datetime
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# Сколько строк читать из БД за раз (на PostgreSQL - серверный курсор)
+EXPORT_CHUNK_SIZE = 2000
+# Минимальный размер куска ответа: не отдаем клиенту каждую строку отдельно
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+ATTEMPT_COLUMNS = {
+    "pk": "ID",
+    "attempt_time": "Время попытки",
+    "mailing_id": "Рассылка",
+    "mailing__message__subject": "Тема",
+    "status": "Статус",
+    "server_response": "Ответ сервера",
+}
+
+RECIPIENT_COLUMNS = {
+    "pk": "ID",
+    "email": "Email",
+    "full_name": "Ф.И.О.",
+    "comment": "Комментарий",
+}
+
+
+class Echo:
+    """Псевдофайл для csv.writer: write возвращает строку, а не пишет ее"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset, columns, format_value=None):
+    """CSV-строки выборки: заголовок и строки по одной, без списка в памяти.
+    BOM в начале - чтобы Excel открыл кириллицу в UTF-8. format_value -
+    форматирование значений (по умолчанию для людей: местное время до секунд)"""
+    format_value = format_value or _format
+    writer = csv.writer(Echo())
+    yield "\ufeff" + writer.writerow(columns.values())
+    rows = queryset.values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for row in rows:
+        yield writer.writerow(format_value(value) for value in row)
+
+
+def _format(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat(sep=" ", timespec="seconds")
+    return value
+
+
+def iter_buffered(lines, size=EXPORT_BUFFER_SIZE):
+    """Склеивает строки в куски не меньше size байт"""
+    buffer = []
+    buffered = 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        buffered += len(data)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_gzip(chunks):
+    """Сжимает поток кусков в формат gzip на лету"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(queryset, columns, filename, compress=False):
+    """Потоковый ответ с CSV-выгрузкой (gzip при compress=True).
+    Память не зависит от числа строк: строки читаются из БД порциями
+    и сразу уходят клиенту"""
+    chunks = iter_buffered(iter_csv(queryset, columns))
+    if compress:
+        chunks = iter_gzip(chunks)
+        filename += ".gz"
+        content_type = "application/gzip"
+    else:
+        content_type = "text/csv; charset=utf-8"
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -1,14 +1,228 @@
+import re
+from datetime import datetime, time, timedelta
+
 from django import forms
+from django.core.validators import validate_email
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .models import Mailing, MailingAttempt, Recipient, Segment
+
+
+class RecipientEmailsField(forms.CharField):
+    """Адреса получателей по одному в строке (или через запятую)"""
+
+    widget = forms.Textarea(attrs={"rows": 3})
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("required", False)
+        super().__init__(**kwargs)
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        # Без повторов, в нижнем регистре, как адреса сохраняет импорт
+        emails = dict.fromkeys(re.split(r"[\s,;]+", value.lower()))
+        return [email for email in emails if email]
+
+    def validate(self, value):
+        super().validate(value)
+        for email in value:
+            validate_email(email)
 
-from .models import Mailing
 
+class RecipientsByEmailMixin:
+    """Состав получателей формы (M2M recipients) меняется списками адресов
+    для добавления и исключения. Форма не загружает ни всех получателей
+    владельца, ни текущий состав: у сегментов их бывают сотни тысяч, и
+    список выбора из всех получателей на каждый показ формы - это мегабайты
+    HTML и запрос без ограничения. Участники видны на странице объекта,
+    большие списки загружаются импортом."""
 
-class MailingForm(forms.ModelForm):
+    def add_recipient_fields(self, owner):
+        self.recipient_owner = owner
+        self.fields["add_recipients"] = RecipientEmailsField(
+            label="Добавить получателей",
+            help_text="Адреса ваших получателей, по одному в строке",
+        )
+        if self.instance.pk:
+            self.fields["remove_recipients"] = RecipientEmailsField(
+                label="Исключить получателей",
+                help_text="Адреса, которые нужно убрать из списка",
+            )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        self.added_recipients = self._recipient_ids("add_recipients")
+        self.removed_recipients = self._recipient_ids("remove_recipients")
+        return cleaned_data
+
+    def _recipient_ids(self, field):
+        emails = self.cleaned_data.get(field)
+        if not emails:
+            return []
+        found = dict(
+            Recipient.objects.filter(owner=self.recipient_owner)
+            .annotate(email_lower=Lower("email"))
+            .filter(email_lower__in=emails)
+            .values_list("email_lower", "pk")
+        )
+        unknown = [email for email in emails if email not in found]
+        if unknown:
+            more = f" и еще {len(unknown) - 10}" if len(unknown) > 10 else ""
+            self.add_error(
+                field, f"Нет получателей с адресами: {', '.join(unknown[:10])}{more}"
+            )
+        return list(found.values())
+
+    def _save_m2m(self):
+        super()._save_m2m()
+        # add/remove вызывают m2m_changed: планировщик и размер сегмента
+        # узнают об изменении состава
+        if self.added_recipients:
+            self.instance.recipients.add(*self.added_recipients)
+        if self.removed_recipients:
+            self.instance.recipients.remove(*self.removed_recipients)
+
+
+class MailingForm(RecipientsByEmailMixin, forms.ModelForm):
     class Meta:
         model = Mailing
-        fields = ("first_send_time", "end_time", "message", "recipients")
+        fields = ("first_send_time", "end_time", "message", "segments")
 
         widgets = {
             "first_send_time": forms.DateTimeInput(attrs={"type": "datetime-local"}),
             "end_time": forms.DateTimeInput(attrs={"type": "datetime-local"}),
         }
+
+    def __init__(self, *args, owner=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Выбор только из сегментов и получателей владельца рассылки
+        self.fields["segments"].queryset = Segment.objects.filter(owner=owner)
+        self.add_recipient_fields(owner)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # Аудитория после сохранения: выбранные сегменты или отдельные
+        # получатели (оставшиеся после исключения и добавленные)
+        has_recipients = bool(self.added_recipients) or (
+            self.instance.pk is not None
+            and self.instance.recipients.exclude(
+                pk__in=self.removed_recipients
+            ).exists()
+        )
+        if not cleaned_data.get("segments") and not has_recipients:
+            raise forms.ValidationError(
+                "Выберите хотя бы один сегмент или добавьте получателей"
+            )
+        return cleaned_data
+
+
+class SegmentForm(RecipientsByEmailMixin, forms.ModelForm):
+    class Meta:
+        model = Segment
+        fields = ("name",)
+
+    def __init__(self, *args, owner=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.add_recipient_fields(owner)
+        self.fields[
+            "add_recipients"
+        ].help_text += ". Большие списки удобнее загружать импортом из CSV/XLSX"
+
+
+class AttemptFilterForm(forms.Form):
+    """Фильтры страницы отчетов"""
+
+    status = forms.ChoiceField(
+        choices=[("", "Все")] + MailingAttempt.STATUS_CHOICES,
+        required=False,
+        label="Статус",
+    )
+    mailing = forms.IntegerField(
+        required=False,
+        min_value=1,
+        label="Рассылка №",
+        widget=forms.TextInput(attrs={"inputmode": "numeric"}),
+    )
+    date_from = forms.DateField(
+        required=False,
+        label="С даты",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+    date_to = forms.DateField(
+        required=False,
+        label="По дату",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+
+    def filter(self, queryset):
+        """Применяет фильтры к попыткам. Даты переводятся в границы по
+        attempt_time, чтобы запрос шел по индексу, а не по attempt_time::date"""
+        data = self.cleaned_data
+        if data["status"]:
+            queryset = queryset.filter(status=data["status"])
+        if data["mailing"]:
+            queryset = queryset.filter(mailing_id=data["mailing"])
+        if data["date_from"]:
+            queryset = queryset.filter(
+                attempt_time__gte=_start_of_day(data["date_from"])
+            )
+        if data["date_to"]:
+            queryset = queryset.filter(
+                attempt_time__lt=_start_of_day(data["date_to"] + timedelta(days=1))
+            )
+        return queryset
+
+    def filter_stats(self, queryset):
+        """Те же фильтры (кроме статуса) для сводки MailingDailyStats"""
+        data = self.cleaned_data
+        if data["mailing"]:
+            queryset = queryset.filter(mailing_id=data["mailing"])
+        if data["date_from"]:
+            queryset = queryset.filter(date__gte=data["date_from"])
+        if data["date_to"]:
+            queryset = queryset.filter(date__lte=data["date_to"])
+        return queryset
+
+
+class RecipientImportForm(forms.Form):
+    file = forms.FileField(
+        label="Файл CSV или XLSX",
+        help_text="Колонки: email, ФИО, комментарий (заголовок необязателен)",
+        widget=forms.ClearableFileInput(attrs={"accept": ".csv,.xlsx"}),
+    )
+    encoding = forms.ChoiceField(
+        choices=[("utf-8-sig", "UTF-8"), ("cp1251", "Windows-1251")],
+        initial="utf-8-sig",
+        label="Кодировка CSV",
+    )
+    segment = forms.ModelChoiceField(
+        queryset=Segment.objects.none(),
+        required=False,
+        label="Добавить в сегмент",
+    )
+    mailing = forms.ModelChoiceField(
+        queryset=Mailing.objects.none(),
+        required=False,
+        label="Добавить в рассылку",
+    )
+
+    def __init__(self, *args, owner=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["segment"].queryset = Segment.objects.filter(owner=owner)
+        self.fields["mailing"].queryset = Mailing.objects.filter(
+            owner=owner
+        ).select_related("message")
+        self.fields["mailing"].label_from_instance = (
+            lambda mailing: f"#{mailing.pk} {mailing.message.subject}"
+        )
+
+    def clean_file(self):
+        file = self.cleaned_data["file"]
+        if not file.name.lower().endswith((".csv", ".xlsx")):
+            raise forms.ValidationError("Поддерживаются файлы .csv и .xlsx")
+        return file
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
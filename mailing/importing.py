@@ -0,0 +1,310 @@
+import codecs
+import csv
+import logging
+import os
+import zipfile
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from .models import Mailing, Recipient, Segment
+from .segments import refresh_sizes
+from .signals import notify_schedule_changed
+from .stats import invalidate_stats
+
+logger = logging.getLogger(__name__)
+
+# Названия колонок в заголовке файла
+EMAIL_COLUMNS = ("email", "e-mail", "почта", "адрес")
+NAME_COLUMNS = ("full_name", "name", "фио", "ф.и.о.", "имя")
+COMMENT_COLUMNS = ("comment", "комментарий")
+
+EMAIL_MAX_LENGTH = Recipient._meta.get_field("email").max_length
+
+# Сколько ошибок по строкам хранить в отчете (остальные только считаются)
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFileError(Exception):
+    """Файл не удалось прочитать: не XLSX, поврежден или в другой кодировке"""
+
+
+class ImportReport:
+    """Итоги импорта получателей"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.existing = 0
+        self.duplicates = 0
+        self.segmented = 0
+        self.attached = 0
+        self.foreign = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, value, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, value, message))
+
+    def summary(self):
+        return (
+            f"строк: {self.rows}, добавлено: {self.created}, "
+            f"уже были: {self.existing}, повторы в файле: {self.duplicates}, "
+            f"чужие адреса: {self.foreign}, ошибок: {self.error_count}, "
+            f"добавлено в сегмент: {self.segmented}, "
+            f"добавлено в рассылку: {self.attached}"
+        )
+
+
+def _iter_csv(file, encoding="utf-8-sig"):
+    """Строки CSV-файла. Разделитель (запятая, точка с запятой, табуляция)
+    определяется по началу файла, BOM из Excel пропускается"""
+    sample = file.read(64 * 1024)
+    file.seek(0)
+    if isinstance(sample, bytes):
+        sample = sample.decode(encoding, errors="ignore")
+        file = codecs.getreader(encoding)(file)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        yield from csv.reader(file, dialect)
+    except UnicodeDecodeError:
+        raise ImportFileError(
+            f"Файл не в кодировке {encoding}: выберите другую кодировку"
+        )
+    except csv.Error as e:
+        raise ImportFileError(f"Некорректный CSV-файл: {e}")
+
+
+def _iter_xlsx(file):
+    """Строки первого листа XLSX в режиме потокового чтения"""
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, OSError) as e:
+        raise ImportFileError(f"Не удалось открыть XLSX-файл: {e}")
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ["" if value is None else str(value) for value in row]
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        raise ImportFileError(f"Поврежденный XLSX-файл: {e}")
+    finally:
+        workbook.close()
+
+
+def iter_rows(file, filename, encoding="utf-8-sig"):
+    """Строки файла (CSV или XLSX) как списки строк, без загрузки файла в память"""
+    if os.path.splitext(filename)[1].lower() == ".xlsx":
+        return _iter_xlsx(file)
+    return _iter_csv(file, encoding)
+
+
+def _find_column(header, names):
+    for index, title in enumerate(header):
+        if title.strip().lower() in names:
+            return index
+    return None
+
+
+def iter_records(rows):
+    """(номер строки, email, ФИО, комментарий) из строк файла.
+
+    Если в первой строке есть колонка email, колонки берутся по заголовку,
+    иначе считается, что колонки идут в порядке email, ФИО, комментарий."""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+
+    email_col = _find_column(first, EMAIL_COLUMNS)
+    if email_col is None:
+        email_col, name_col, comment_col = 0, 1, 2
+        start = 1
+        rows = _chain_first(first, rows)
+    else:
+        name_col = _find_column(first, NAME_COLUMNS)
+        comment_col = _find_column(first, COMMENT_COLUMNS)
+        start = 2
+
+    for line, row in enumerate(rows, start=start):
+        if not any(cell.strip() for cell in row):
+            continue
+        yield (
+            line,
+            _cell(row, email_col),
+            _cell(row, name_col),
+            _cell(row, comment_col),
+        )
+
+
+def _chain_first(first, rows):
+    yield first
+    yield from rows
+
+
+def _cell(row, index):
+    if index is None or index >= len(row):
+        return ""
+    return row[index].strip()
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class RecipientImporter:
+    """Потоковый импорт получателей пачками.
+
+    Адреса нормализуются (регистр, пробелы), повторы внутри файла
+    отбрасываются, для каждой пачки одним запросом выясняется, какие адреса
+    уже есть в базе без учета регистра (индекс recipient_email_lower_idx),
+    новые добавляются через bulk_create(ignore_conflicts=True). Получатели
+    владельца добавляются в сегмент и прикрепляются к рассылке напрямую
+    через промежуточные таблицы M2M. Импорт идет в одной транзакции: если
+    файл окажется нечитаемым посередине, ничего не сохранится."""
+
+    def __init__(
+        self, owner=None, mailing=None, segment=None, batch_size=1000, progress=None
+    ):
+        self.owner = owner
+        self.mailing = mailing
+        self.segment = segment
+        self.batch_size = batch_size
+        self.progress = progress
+        self.report = ImportReport()
+        self._seen = set()
+
+    def run(self, records):
+        with transaction.atomic():
+            self._import(records)
+            if self.segment is not None:
+                # bulk_create не вызывает m2m_changed
+                refresh_sizes([self.segment.pk])
+        self._finish()
+        return self.report
+
+    def _import(self, records):
+        batch = []
+        for line, email, full_name, comment in records:
+            self.report.rows += 1
+            email = normalize_email(email)
+            try:
+                if len(email) > EMAIL_MAX_LENGTH:
+                    raise ValidationError("Слишком длинный email")
+                validate_email(email)
+            except ValidationError:
+                self.report.add_error(line, email, "Некорректный email")
+                continue
+            if email in self._seen:
+                self.report.duplicates += 1
+                continue
+            self._seen.add(email)
+
+            batch.append(
+                Recipient(
+                    email=email,
+                    full_name=full_name[:255] or email,
+                    comment=comment or None,
+                    owner=self.owner,
+                )
+            )
+            if len(batch) >= self.batch_size:
+                self._save_batch(batch)
+                batch = []
+
+        if batch:
+            self._save_batch(batch)
+
+    def _save_batch(self, batch):
+        emails = [recipient.email for recipient in batch]
+        existing = dict(_by_email(emails).values_list("email_lower", "owner_id"))
+        new = [recipient for recipient in batch if recipient.email not in existing]
+        Recipient.objects.bulk_create(new, ignore_conflicts=True)
+        owner_id = self.owner.pk if self.owner else None
+        # ignore_conflicts молча пропускает адреса, добавленные параллельно
+        # другим импортом: считаем только строки, которые вставили мы
+        created = 0
+        if new:
+            created = (
+                _by_email([recipient.email for recipient in new])
+                .filter(owner_id=owner_id)
+                .count()
+            )
+        self.report.created += created
+        self.report.existing += len(existing) + len(new) - created
+        self.report.foreign += sum(
+            1 for email_owner in existing.values() if email_owner != owner_id
+        ) + (len(new) - created)
+
+        if self.segment is not None or self.mailing is not None:
+            self._attach(emails)
+
+        if self.progress:
+            self.progress(self.report)
+
+    def _attach(self, emails):
+        """Добавляет получателей пачки в сегмент и рассылку. Адреса, которые
+        уже принадлежат другому владельцу, не добавляются"""
+        owner_id = self.owner.pk if self.owner else None
+        recipient_ids = list(
+            _by_email(emails).filter(owner_id=owner_id).values_list("pk", flat=True)
+        )
+        if self.segment is not None:
+            through = Segment.recipients.through
+            through.objects.bulk_create(
+                [
+                    through(segment_id=self.segment.pk, recipient_id=recipient_id)
+                    for recipient_id in recipient_ids
+                ],
+                ignore_conflicts=True,
+            )
+            self.report.segmented += len(recipient_ids)
+        if self.mailing is not None:
+            through = Mailing.recipients.through
+            through.objects.bulk_create(
+                [
+                    through(mailing_id=self.mailing.pk, recipient_id=recipient_id)
+                    for recipient_id in recipient_ids
+                ],
+                ignore_conflicts=True,
+            )
+            self.report.attached += len(recipient_ids)
+
+    def _finish(self):
+        # bulk_create не вызывает сигналы: сбрасываем статистику и будим
+        # планировщик, если у рассылок появились получатели
+        invalidate_stats([self.owner.pk] if self.owner else [])
+        if self.report.attached or self.report.segmented:
+            notify_schedule_changed()
+        logger.info(f"Импорт получателей завершен: {self.report.summary()}")
+
+
+def _by_email(emails):
+    """Получатели с адресами из emails (в нижнем регистре) без учета регистра
+    адреса в базе: на PostgreSQL сравнение строк регистрозависимо"""
+    return Recipient.objects.annotate(email_lower=Lower("email")).filter(
+        email_lower__in=emails
+    )
+
+
+def import_recipients(
+    file,
+    filename,
+    owner=None,
+    mailing=None,
+    segment=None,
+    encoding="utf-8-sig",
+    **kwargs,
+):
+    """Импортирует получателей из CSV/XLSX-файла, возвращает ImportReport.
+    Нечитаемый файл - ImportFileError, база при этом не меняется"""
+    importer = RecipientImporter(owner, mailing, segment, **kwargs)
+    return importer.run(iter_records(iter_rows(file, filename, encoding)))
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.archiving import archive_attempts
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит попытки рассылок старше срока хранения "
+        "(MAILING_ATTEMPT_RETENTION_DAYS) в сжатые CSV-файлы по дням "
+        "и удаляет их из базы. Итоги за эти дни остаются в сводке."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.MAILING_ATTEMPT_RETENTION_DAYS,
+            help="Сколько последних дней попыток оставить в базе",
+        )
+        parser.add_argument(
+            "--dir",
+            default=settings.MAILING_ARCHIVE_DIR,
+            help="Каталог файлов архива (MAILING_ARCHIVE_DIR)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, сколько попыток будет перенесено",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 1:
+            raise CommandError("Срок хранения должен быть не меньше одного дня")
+
+        def progress(day, rows):
+            self.stdout.write(f"{day}: {rows} попыток")
+
+        try:
+            archived = archive_attempts(
+                options["days"], options["dir"], options["dry_run"], progress
+            )
+        except OSError as e:
+            raise CommandError(f"Не удалось записать архив: {e}")
+
+        total = sum(rows for _, rows in archived)
+        if options["dry_run"]:
+            self.stdout.write(f"Будет перенесено попыток: {total}")
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Перенесено в архив попыток: {total}, дней: {len(archived)}"
+                )
+            )
@@ -0,0 +1,101 @@
+import time
+from collections import namedtuple
+
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine
+
+from mailing.models import Message
+from mailing.rendering import PreparedMessage
+
+# Строка шарда журнала доставки, как ее возвращает claim_deliveries
+Row = namedtuple("Row", ("pk", "attempts", "email", "full_name"))
+
+GREETING = "Здравствуйте, {{ full_name }}!\n\n"
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарк сборки писем: новое EmailMessage на каждого получателя "
+        "против PreparedMessage, собранного один раз, и персонализация "
+        "шаблонизатором Django против скомпилированного шаблона"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count", type=int, default=10000, help="Сколько писем собрать"
+        )
+        parser.add_argument(
+            "--body-size", type=int, default=2000, help="Размер тела письма, символов"
+        )
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        body = ("Текст тестового письма рассылки. " * options["body_size"])[
+            : options["body_size"]
+        ]
+        message = Message(subject="Тестовая рассылка", body=body)
+        from_email = PreparedMessage(message).from_email
+        rows = [
+            Row(i, 0, f"user{i}@example.com", f"Получатель {i}") for i in range(count)
+        ]
+
+        def build_each(row):
+            email = EmailMessage(
+                subject=message.subject,
+                body=message.body,
+                from_email=from_email,
+                to=[row.email],
+            )
+            return email.message().as_bytes(linesep="\r\n")
+
+        naive = self._measure(build_each, rows)
+
+        def render_prepared(row, prepared=PreparedMessage(message)):
+            return prepared.render(row.email).data
+
+        cached = self._measure(render_prepared, rows)
+
+        # Персонализированное письмо: обращение по имени в теме и тексте
+        personal = Message(
+            subject="{{ full_name }}, тестовая рассылка", body=GREETING + body
+        )
+        engine = Engine()
+        subject_template = engine.from_string(personal.subject)
+        body_template = engine.from_string(personal.body)
+
+        def render_engine(row):
+            context = Context({"email": row.email, "full_name": row.full_name})
+            email = EmailMessage(
+                subject=subject_template.render(context),
+                body=body_template.render(context),
+                from_email=from_email,
+                to=[row.email],
+            )
+            return email.message().as_bytes(linesep="\r\n")
+
+        engine_each = self._measure(render_engine, rows)
+
+        def render_personalized(row, prepared=PreparedMessage(personal)):
+            return prepared.render(row.email, row).data
+
+        compiled = self._measure(render_personalized, rows)
+
+        self.stdout.write(f"Писем: {count}, размер тела: {len(body)} символов")
+        self.stdout.write(f"EmailMessage на получателя: {naive:.1f} мкс/письмо")
+        self.stdout.write(f"PreparedMessage:            {cached:.1f} мкс/письмо")
+        self.stdout.write(self.style.SUCCESS(f"Ускорение: x{naive / cached:.1f}"))
+        self.stdout.write("Персонализация ({{ full_name }} в теме и тексте):")
+        self.stdout.write(f"Шаблонизатор Django:        {engine_each:.1f} мкс/письмо")
+        self.stdout.write(f"Скомпилированный шаблон:    {compiled:.1f} мкс/письмо")
+        self.stdout.write(
+            self.style.SUCCESS(f"Ускорение: x{engine_each / compiled:.1f}")
+        )
+
+    @staticmethod
+    def _measure(build, rows):
+        """Среднее время сборки одного письма в микросекундах"""
+        started = time.perf_counter()
+        for row in rows:
+            build(row)
+        return (time.perf_counter() - started) / len(rows) * 1_000_000
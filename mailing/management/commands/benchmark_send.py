@@ -0,0 +1,138 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.benchmark import (BenchmarkError, compare_with_baseline,
+                               load_baseline, run_send_benchmark,
+                               save_baseline)
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк отправки: создает тестовых получателей и рассылки, отправляет "
+        "их на локальную заглушку SMTP и выводит письма/с, p50/p99, SQL-запросы "
+        "на письмо и пиковую память. Запускайте на базе для разработки: "
+        "в режимах process и async бенчмарк не запустится, если в базе есть "
+        "другие активные рассылки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recipients", type=int, default=1000, help="Сколько получателей создать"
+        )
+        parser.add_argument(
+            "--mailings",
+            type=int,
+            default=1,
+            help="Сколько рассылок создать (в каждой все получатели)",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=["process", "async", "send"],
+            default="process",
+            help="process - process_mailings (пул потоков), "
+            "async - process_mailings с asyncio и пулом SMTP-соединений, "
+            "send - send_mailing по одной рассылке",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Задержка ответа заглушки SMTP на письмо, мс",
+        )
+        parser.add_argument(
+            "--failure-rate",
+            type=float,
+            default=0.0,
+            help="Доля получателей, которым заглушка отказывает (0..1)",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            help="Размер пула отправки (для async - число SMTP-соединений)",
+        )
+        parser.add_argument(
+            "--per-mailing", type=int, help="Пачек одной рассылки одновременно"
+        )
+        parser.add_argument(
+            "--body-size", type=int, default=2000, help="Размер тела письма, символов"
+        )
+        parser.add_argument(
+            "--save-baseline", metavar="PATH", help="Сохранить результат в JSON"
+        )
+        parser.add_argument(
+            "--compare", metavar="PATH", help="Сравнить с сохраненным результатом"
+        )
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            help="Завершиться с ошибкой, если метрика хуже базовой больше, чем на N %%",
+        )
+
+    def handle(self, *args, **options):
+        params = {
+            "recipients": options["recipients"],
+            "mailings": options["mailings"],
+            "mode": options["mode"],
+            "latency_ms": options["latency"],
+            "failure_rate": options["failure_rate"],
+            "threads": options["threads"],
+            "per_mailing": options["per_mailing"],
+            "body_size": options["body_size"],
+        }
+        try:
+            result = run_send_benchmark(
+                options["recipients"],
+                options["mailings"],
+                mode=options["mode"],
+                latency=options["latency"] / 1000,
+                failure_rate=options["failure_rate"],
+                max_workers=options["threads"],
+                per_mailing=options["per_mailing"],
+                body_size=options["body_size"],
+            )
+        except BenchmarkError as e:
+            raise CommandError(e)
+
+        self.stdout.write(
+            f"Писем: {result['emails']} (принято {result['accepted']}, "
+            f"отклонено {result['rejected']}) за {result['seconds']} с"
+        )
+        self.stdout.write(f"Писем в секунду:     {result['emails_per_second']}")
+        self.stdout.write(
+            f"Отправка письма:     p50 {result['latency_p50_ms']} мс, "
+            f"p99 {result['latency_p99_ms']} мс"
+        )
+        self.stdout.write(f"SQL-запросов/письмо: {result['queries_per_email']}")
+        self.stdout.write(f"Пиковая память:      {result['peak_rss_mb']} МБ")
+
+        if options["save_baseline"]:
+            save_baseline(options["save_baseline"], result, params)
+            self.stdout.write(
+                self.style.SUCCESS(f"Результат сохранен в {options['save_baseline']}")
+            )
+
+        if options["compare"]:
+            baseline = load_baseline(options["compare"])
+            if baseline["params"] != params:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Параметры отличаются от базовых: {baseline['params']}"
+                    )
+                )
+            regressions = []
+            for metric, before, after, change, regression in compare_with_baseline(
+                result, baseline
+            ):
+                line = f"{metric}: {before} -> {after} ({change:+.1f}%)"
+                if (
+                    options["max_regression"] is not None
+                    and regression > options["max_regression"]
+                ):
+                    regressions.append(metric)
+                    self.stdout.write(self.style.ERROR(line))
+                else:
+                    self.stdout.write(line)
+            if regressions:
+                raise CommandError(
+                    f"Ухудшение больше {options['max_regression']}%: "
+                    f"{', '.join(regressions)}"
+                )
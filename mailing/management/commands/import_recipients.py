@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.importing import ImportFileError, import_recipients
+from mailing.models import Mailing, Segment
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Импортирует получателей из CSV или XLSX-файла"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу .csv или .xlsx")
+        parser.add_argument("--owner", help="Email владельца новых получателей")
+        parser.add_argument(
+            "--mailing", type=int, help="Добавить получателей в рассылку с этим id"
+        )
+        parser.add_argument(
+            "--segment", type=int, help="Добавить получателей в сегмент с этим id"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Размер пачки вставки"
+        )
+        parser.add_argument(
+            "--encoding",
+            default="utf-8-sig",
+            help="Кодировка CSV-файла (например, cp1251 для Excel)",
+        )
+
+    def handle(self, *args, **options):
+        owner = None
+        if options["owner"]:
+            owner = User.objects.filter(email=options["owner"]).first()
+            if owner is None:
+                raise CommandError(f"Пользователь {options['owner']} не найден")
+
+        mailing = None
+        if options["mailing"]:
+            mailing = Mailing.objects.filter(pk=options["mailing"]).first()
+            if mailing is None:
+                raise CommandError(f"Рассылка {options['mailing']} не найдена")
+            if mailing.owner_id != (owner.pk if owner else None):
+                raise CommandError("Рассылка принадлежит другому владельцу")
+
+        segment = None
+        if options["segment"]:
+            segment = Segment.objects.filter(pk=options["segment"]).first()
+            if segment is None:
+                raise CommandError(f"Сегмент {options['segment']} не найден")
+            if segment.owner_id != (owner.pk if owner else None):
+                raise CommandError("Сегмент принадлежит другому владельцу")
+
+        def progress(report):
+            self.stdout.write(
+                f"Обработано строк: {report.rows}, добавлено: {report.created}"
+            )
+
+        try:
+            with open(options["path"], "rb") as file:
+                report = import_recipients(
+                    file,
+                    options["path"],
+                    owner=owner,
+                    mailing=mailing,
+                    segment=segment,
+                    encoding=options["encoding"],
+                    batch_size=options["batch_size"],
+                    progress=progress,
+                )
+        except OSError as e:
+            raise CommandError(f"Не удалось прочитать файл: {e}")
+        except ImportFileError as e:
+            raise CommandError(f"{e}. Получатели не импортированы")
+
+        for line, value, message in report.errors:
+            self.stderr.write(f"Строка {line}: {message} ({value})")
+        if report.error_count > len(report.errors):
+            self.stderr.write(
+                f"...и еще {report.error_count - len(report.errors)} ошибок"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Импорт завершен: {report.summary()}"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from mailing.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает сводку попыток по рассылкам и дням (MailingDailyStats) "
+        "из MailingAttempt. Запускайте при остановленных обработчиках: "
+        "попытки, записанные во время пересчета, могут не попасть в сводку."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mailing",
+            type=int,
+            action="append",
+            dest="mailings",
+            help="Пересчитать только эту рассылку (можно указать несколько раз)",
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups(options["mailings"])
+        self.stdout.write(self.style.SUCCESS(f"Сводка пересчитана, строк: {rows}"))
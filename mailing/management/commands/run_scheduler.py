@@ -1,19 +1,64 @@
 import logging
 import time
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from mailing.metrics import start_exporter
 from mailing.scheduler import start_scheduler
 
 logger = logging.getLogger("scheduler")
 
 
 class Command(BaseCommand):
-    help = "Запускает планировщик APScheduler в отдельном процессе."
+    help = "Запускает планировщик рассылок в отдельном процессе."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            help="Сколько пачек получателей отправлять одновременно "
+            "(по умолчанию MAILING_MAX_WORKERS)",
+        )
+        parser.add_argument(
+            "--per-mailing",
+            type=int,
+            help="Сколько пачек одной рассылки отправлять одновременно "
+            "(по умолчанию MAILING_MAX_WORKERS_PER_MAILING)",
+        )
+        parser.add_argument(
+            "--async",
+            dest="use_async",
+            action="store_true",
+            default=None,
+            help="Отправлять из цикла событий asyncio через пул SMTP-соединений "
+            "(по умолчанию MAILING_ASYNC_SMTP)",
+        )
+        parser.add_argument(
+            "--connections",
+            type=int,
+            help="Размер пула SMTP-соединений для --async "
+            "(по умолчанию MAILING_ASYNC_POOL_SIZE)",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            default=settings.MAILING_METRICS_PORT,
+            help="Порт HTTP-экспортера метрик Prometheus "
+            "(по умолчанию MAILING_METRICS_PORT, 0 - выключен)",
+        )
 
     def handle(self, *args, **options):
+        if options["metrics_port"]:
+            start_exporter(options["metrics_port"])
+
         # 1. Запуск планировщика
-        start_scheduler()
+        scheduler = start_scheduler(
+            options["threads"],
+            options["per_mailing"],
+            options["use_async"],
+            options["connections"],
+        )
 
         self.stdout.write(self.style.SUCCESS("Планировщик рассылок запущен успешно."))
         self.stdout.write("Для остановки нажмите CTRL+C.")
@@ -24,4 +69,7 @@ class Command(BaseCommand):
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
+            # Дожидаемся текущей задачи, чтобы буфер попыток успел записаться в БД
+            if scheduler.running:
+                scheduler.shutdown(wait=True)
             self.stdout.write("\nПланировщик остановлен пользователем.")
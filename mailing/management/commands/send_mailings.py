@@ -1,12 +1,62 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 from mailing.services import process_mailings
+from mailing.workers import WorkerError
 
 
 class Command(BaseCommand):
     help = "Отправляет активные рассылки"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            help="Сколько пачек получателей отправлять одновременно "
+            "(по умолчанию MAILING_MAX_WORKERS)",
+        )
+        parser.add_argument(
+            "--per-mailing",
+            type=int,
+            help="Сколько пачек одной рассылки отправлять одновременно "
+            "(по умолчанию MAILING_MAX_WORKERS_PER_MAILING)",
+        )
+        parser.add_argument(
+            "--async",
+            dest="use_async",
+            action="store_true",
+            default=None,
+            help="Отправлять из цикла событий asyncio через пул SMTP-соединений "
+            "(по умолчанию MAILING_ASYNC_SMTP)",
+        )
+        parser.add_argument(
+            "--connections",
+            type=int,
+            help="Размер пула SMTP-соединений для --async "
+            "(по умолчанию MAILING_ASYNC_POOL_SIZE)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Сколько процессов отправки запустить: получатели делятся "
+            "между процессами, у каждого свои соединения с БД и SMTP",
+        )
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS("Начинаю обработку рассылок..."))
-        process_mailings()
+        try:
+            processed = process_mailings(
+                options["threads"],
+                options["per_mailing"],
+                options["use_async"],
+                options["connections"],
+                options["workers"],
+            )
+        except WorkerError as e:
+            raise CommandError(
+                f"{e}. Обработано получателей: {sum(e.processed.values())}"
+            )
+        self.stdout.write(
+            f"Рассылок: {len(processed)}, получателей: {sum(processed.values())}"
+        )
         self.stdout.write(self.style.SUCCESS("Обработка рассылок завершена."))
@@ -0,0 +1,99 @@
+import logging
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин от долей миллисекунды (отправка одного письма, сборка
+# заголовков) до минут (тик планировщика с большой рассылкой)
+DURATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    300,
+)
+
+# Этапы конвейера отправки (значения метки stage):
+# active_query - выборка активных рассылок, delivery_sync - заведение журнала
+# доставки, recipient_fetch - аренда шарда получателей, message_build - сборка
+# MIME сообщения, smtp_connect - подключение к SMTP-серверу, smtp_send -
+# отправка одного письма, attempt_persist - запись пачки попыток и журнала,
+# status_transitions - смена статусов рассылок за тик
+STAGE_SECONDS = Histogram(
+    "mailing_stage_duration_seconds",
+    "Длительность этапов конвейера отправки",
+    ["stage"],
+    buckets=DURATION_BUCKETS,
+)
+
+EMAILS = Counter(
+    "mailing_emails_total",
+    "Обработанные письма по результату отправки",
+    ["result"],
+)
+
+ATTEMPTS_PERSISTED = Counter(
+    "mailing_attempts_persisted_total",
+    "Попытки рассылки, записанные в БД",
+)
+
+SMTP_CONNECTIONS = Counter(
+    "mailing_smtp_connections_total",
+    "Открытые SMTP-соединения (включая переподключения)",
+)
+
+TICKS = Counter("mailing_ticks_total", "Выполненные тики обработки рассылок")
+
+TICK_SECONDS = Histogram(
+    "mailing_tick_duration_seconds",
+    "Длительность тика обработки рассылок",
+    buckets=DURATION_BUCKETS,
+)
+
+LAST_TICK_SECONDS = Gauge(
+    "mailing_last_tick_duration_seconds",
+    "Длительность последнего тика обработки рассылок",
+)
+
+LAST_TICK_TIMESTAMP = Gauge(
+    "mailing_last_tick_timestamp_seconds",
+    "Время окончания последнего тика (unixtime)",
+)
+
+ACTIVE_MAILINGS = Gauge(
+    "mailing_active_mailings",
+    "Активные рассылки в последнем тике",
+)
+
+
+def stage(name):
+    """Контекстный менеджер/декоратор, замеряющий длительность этапа"""
+    return STAGE_SECONDS.labels(name).time()
+
+
+def record_tick(duration, active_mailings):
+    """Фиксирует завершенный тик обработки рассылок"""
+    TICKS.inc()
+    TICK_SECONDS.observe(duration)
+    LAST_TICK_SECONDS.set(duration)
+    LAST_TICK_TIMESTAMP.set_to_current_time()
+    ACTIVE_MAILINGS.set(active_mailings)
+
+
+def start_exporter(port):
+    """Отдает метрики процесса-обработчика по HTTP на отдельном порту"""
+    start_http_server(port)
+    logger.info(f"Метрики рассылок доступны на порту {port} (/metrics)")
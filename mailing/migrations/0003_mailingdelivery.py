@@ -0,0 +1,124 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_deliveries(apps, schema_editor):
+    """Уже запущенные рассылки отправлялись всем получателям на каждом тике,
+    поэтому их текущие получатели отмечаются доставленными."""
+    Mailing = apps.get_model("mailing", "Mailing")
+    MailingDelivery = apps.get_model("mailing", "MailingDelivery")
+
+    links = (
+        Mailing.recipients.through.objects.filter(
+            mailing__status__in=["Запущена", "Завершена"]
+        )
+        .values_list("mailing_id", "recipient_id")
+        .iterator(chunk_size=2000)
+    )
+    batch = []
+    for mailing_id, recipient_id in links:
+        batch.append(
+            MailingDelivery(
+                mailing_id=mailing_id, recipient_id=recipient_id, status="Доставлено"
+            )
+        )
+        if len(batch) >= 2000:
+            MailingDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    MailingDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailingDelivery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Ожидает", "Ожидает"),
+                            ("Доставлено", "Доставлено"),
+                            ("Ошибка", "Ошибка"),
+                        ],
+                        default="Ожидает",
+                        max_length=10,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Число попыток"
+                    ),
+                ),
+                (
+                    "last_attempt_time",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время последней попытки"
+                    ),
+                ),
+                (
+                    "next_attempt_time",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время следующей попытки"
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True, null=True, verbose_name="Последняя ошибка"
+                    ),
+                ),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deliveries",
+                        to="mailing.mailing",
+                        verbose_name="Рассылка",
+                    ),
+                ),
+                (
+                    "recipient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="mailing.recipient",
+                        verbose_name="Получатель",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Доставка получателю",
+                "verbose_name_plural": "Журнал доставки",
+                "indexes": [
+                    models.Index(
+                        fields=["mailing", "status", "next_attempt_time"],
+                        name="delivery_pending_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("mailing", "recipient"), name="unique_mailing_delivery"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_deliveries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0003_mailingdelivery"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="mailingdelivery",
+            name="delivery_pending_idx",
+        ),
+        migrations.AddIndex(
+            model_name="mailingdelivery",
+            index=models.Index(
+                condition=models.Q(("status__in", ["Ожидает", "Ошибка"])),
+                fields=["mailing", "id"],
+                name="delivery_unsent_idx",
+            ),
+        ),
+    ]
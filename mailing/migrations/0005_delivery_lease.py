@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0004_delivery_unsent_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailingdelivery",
+            name="claimed_by",
+            field=models.CharField(
+                blank=True, max_length=255, null=True, verbose_name="Обработчик"
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailingdelivery",
+            name="lease_expires_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Аренда истекает"
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0005_delivery_lease"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mailingdelivery",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("Ожидает", "Ожидает"),
+                    ("Доставлено", "Доставлено"),
+                    ("Ошибка", "Ошибка"),
+                    ("Отклонено", "Отклонено"),
+                ],
+                default="Ожидает",
+                max_length=10,
+                verbose_name="Статус",
+            ),
+        ),
+    ]
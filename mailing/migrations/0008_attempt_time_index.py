@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0007_scheduler_report_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="mailingattempt",
+            index=models.Index(fields=["attempt_time", "id"], name="attempt_time_idx"),
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    """Сводка по уже записанным попыткам"""
+    MailingAttempt = apps.get_model("mailing", "MailingAttempt")
+    MailingDailyStats = apps.get_model("mailing", "MailingDailyStats")
+    rows = (
+        MailingAttempt.objects.annotate(date=TruncDate("attempt_time"))
+        .values("mailing_id", "mailing__owner_id", "date")
+        .annotate(
+            sent=Count("pk", filter=Q(status="Успешно")),
+            failed=Count("pk", filter=~Q(status="Успешно")),
+        )
+        .order_by()
+    )
+    MailingDailyStats.objects.bulk_create(
+        [
+            MailingDailyStats(
+                mailing_id=row["mailing_id"],
+                owner_id=row["mailing__owner_id"],
+                date=row["date"],
+                sent=row["sent"],
+                failed=row["failed"],
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0008_attempt_time_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailingDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Дата")),
+                (
+                    "sent",
+                    models.PositiveIntegerField(default=0, verbose_name="Успешно"),
+                ),
+                (
+                    "failed",
+                    models.PositiveIntegerField(default=0, verbose_name="Не успешно"),
+                ),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="mailing.mailing",
+                        verbose_name="Рассылка",
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика рассылки за день",
+                "verbose_name_plural": "Статистика рассылок по дням",
+                "indexes": [
+                    models.Index(fields=["owner", "date"], name="stats_owner_date_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("mailing", "date"), name="unique_mailing_daily_stats"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
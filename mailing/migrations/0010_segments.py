@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0009_mailingdailystats"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mailing",
+            name="recipients",
+            field=models.ManyToManyField(
+                blank=True, to="mailing.recipient", verbose_name="Отдельные получатели"
+            ),
+        ),
+        migrations.CreateModel(
+            name="Segment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, verbose_name="Название")),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец",
+                    ),
+                ),
+                (
+                    "recipients",
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name="segments",
+                        to="mailing.recipient",
+                        verbose_name="Получатели",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Сегмент получателей",
+                "verbose_name_plural": "Сегменты получателей",
+                "permissions": [
+                    ("can_view_all_segments", "Может просматривать все сегменты")
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name="mailing",
+            name="segments",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="mailings",
+                to="mailing.segment",
+                verbose_name="Сегменты",
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0011_mailing_status_history"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailingAttemptArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Дата")),
+                ("file", models.CharField(max_length=255, verbose_name="Файл")),
+                ("rows", models.PositiveIntegerField(verbose_name="Попыток")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Перенесено"),
+                ),
+            ],
+            options={
+                "verbose_name": "Архив попыток",
+                "verbose_name_plural": "Архивы попыток",
+                "indexes": [
+                    models.Index(fields=["date"], name="attempt_archive_date_idx")
+                ],
+            },
+        ),
+    ]
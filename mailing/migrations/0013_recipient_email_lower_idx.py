@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:26
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0012_attempt_archive"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipient",
+            index=models.Index(
+                django.db.models.functions.text.Lower("email"),
+                name="recipient_email_lower_idx",
+            ),
+        ),
+    ]
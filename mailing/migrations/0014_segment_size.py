@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_segment_sizes(apps, schema_editor):
+    """Число участников уже созданных сегментов"""
+    Segment = apps.get_model("mailing", "Segment")
+    members = (
+        Segment.recipients.through.objects.filter(segment_id=OuterRef("pk"))
+        .order_by()
+        .values("segment_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Segment.objects.update(size=Coalesce(Subquery(members), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0013_recipient_email_lower_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="segment",
+            name="size",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Участников"
+            ),
+        ),
+        migrations.RunPython(backfill_segment_sizes, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Lower
+
+from .personalization import PLACEHOLDERS, unknown_placeholders
 
 
 class Recipient(models.Model):
@@ -22,6 +26,10 @@ class Recipient(models.Model):
         permissions = [
             ("can_view_all_recipients", "Может просматривать всех получателей"),
         ]
+        indexes = [
+            # Поиск существующих адресов без учета регистра при импорте
+            models.Index(Lower("email"), name="recipient_email_lower_idx"),
+        ]
 
     def __str__(self):
         return f"{self.full_name} ({self.email})"
@@ -50,6 +58,52 @@ class Message(models.Model):
     def __str__(self):
         return self.subject
 
+    def clean(self):
+        available = ", ".join(f"{{{{ {name} }}}}" for name in PLACEHOLDERS)
+        errors = {}
+        for field in ("subject", "body"):
+            unknown = unknown_placeholders(getattr(self, field))
+            if unknown:
+                errors[field] = (
+                    f"Неизвестные поля: {', '.join(unknown)}. Доступны: {available}"
+                )
+        if errors:
+            raise ValidationError(errors)
+
+
+class Segment(models.Model):
+    """Именованный список получателей. Рассылки ссылаются на сегменты, поэтому
+    состав аудитории хранится один раз, а не копией в каждой рассылке"""
+
+    name = models.CharField(max_length=255, verbose_name="Название")
+    recipients = models.ManyToManyField(
+        Recipient, blank=True, related_name="segments", verbose_name="Получатели"
+    )
+    # Число участников: пересчитывается при изменении состава (segments.py),
+    # чтобы списки сегментов и рассылок не считали участников при каждом показе
+    size = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Участников"
+    )
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name="Владелец",
+    )
+
+    class Meta:
+        verbose_name = "Сегмент получателей"
+        verbose_name_plural = "Сегменты получателей"
+
+        permissions = [
+            ("can_view_all_segments", "Может просматривать все сегменты"),
+        ]
+
+    def __str__(self):
+        return self.name
+
 
 class Mailing(models.Model):
     STATUS_CHOICES = [
@@ -67,7 +121,13 @@ class Mailing(models.Model):
     message = models.ForeignKey(
         Message, on_delete=models.CASCADE, verbose_name="Сообщение"
     )
-    recipients = models.ManyToManyField(Recipient, verbose_name="Получатели")
+    # Аудитория рассылки: участники сегментов и отдельные получатели
+    segments = models.ManyToManyField(
+        Segment, blank=True, related_name="mailings", verbose_name="Сегменты"
+    )
+    recipients = models.ManyToManyField(
+        Recipient, blank=True, verbose_name="Отдельные получатели"
+    )
 
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -85,6 +145,16 @@ class Mailing(models.Model):
             ("can_view_all_mailings", "Может просматривать все рассылки"),
             ("can_disable_mailings", "Может отключатть рассылки"),
         ]
+        indexes = [
+            # Незавершенные рассылки: выборка активных в process_mailings,
+            # расписание планировщика и завершение рассылок по end_time.
+            # Завершенных рассылок со временем большинство, в индекс они не входят
+            models.Index(
+                fields=["end_time", "first_send_time"],
+                condition=models.Q(status__in=["Создана", "Запущена"]),
+                name="mailing_active_idx",
+            ),
+        ]
 
 
 class MailingAttempt(models.Model):
@@ -104,9 +174,174 @@ class MailingAttempt(models.Model):
     )
 
     mailing = models.ForeignKey(
-        Mailing, on_delete=models.CASCADE, verbose_name="Рассылка"
+        Mailing,
+        on_delete=models.CASCADE,
+        # Поиск по рассылке покрывает составной индекс ниже
+        db_index=False,
+        verbose_name="Рассылка",
     )
 
     class Meta:
         verbose_name = "Попытка рассылки"
         verbose_name_plural = "Попытки рассылок"
+        indexes = [
+            # Отчеты: попытки рассылок (в том числе всех рассылок владельца)
+            # в порядке времени
+            models.Index(
+                fields=["mailing", "attempt_time"], name="attempt_mailing_time_idx"
+            ),
+            # Отчеты менеджера по всем рассылкам: страницы по курсору
+            # (attempt_time, id) в порядке убывания
+            models.Index(fields=["attempt_time", "id"], name="attempt_time_idx"),
+        ]
+
+
+class MailingDelivery(models.Model):
+    """Журнал доставки: состояние отправки рассылки конкретному получателю"""
+
+    STATUS_CHOICES = [
+        ("Ожидает", "Ожидает"),
+        ("Доставлено", "Доставлено"),
+        ("Ошибка", "Ошибка"),
+        ("Отклонено", "Отклонено"),
+    ]
+
+    mailing = models.ForeignKey(
+        Mailing,
+        on_delete=models.CASCADE,
+        related_name="deliveries",
+        verbose_name="Рассылка",
+    )
+    recipient = models.ForeignKey(
+        Recipient, on_delete=models.CASCADE, verbose_name="Получатель"
+    )
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="Ожидает", verbose_name="Статус"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Число попыток")
+    last_attempt_time = models.DateTimeField(
+        null=True, blank=True, verbose_name="Время последней попытки"
+    )
+    next_attempt_time = models.DateTimeField(
+        null=True, blank=True, verbose_name="Время следующей попытки"
+    )
+    last_error = models.TextField(
+        null=True, blank=True, verbose_name="Последняя ошибка"
+    )
+    # Аренда шарда: какой процесс забрал получателя и до какого времени
+    claimed_by = models.CharField(
+        max_length=255, null=True, blank=True, verbose_name="Обработчик"
+    )
+    lease_expires_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Аренда истекает"
+    )
+
+    class Meta:
+        verbose_name = "Доставка получателю"
+        verbose_name_plural = "Журнал доставки"
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["mailing", "recipient"], name="unique_mailing_delivery"
+            ),
+        ]
+        indexes = [
+            # Постраничная выборка неотправленных получателей по ключу (mailing, id)
+            models.Index(
+                fields=["mailing", "id"],
+                condition=models.Q(status__in=["Ожидает", "Ошибка"]),
+                name="delivery_unsent_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.mailing_id} -> {self.recipient_id}: {self.status}"
+
+
+class MailingDailyStats(models.Model):
+    """Сводка попыток рассылки за день: обновляется при записи попыток,
+    чтобы отчеты и статистика не пересчитывали всю историю MailingAttempt"""
+
+    mailing = models.ForeignKey(
+        Mailing,
+        on_delete=models.CASCADE,
+        related_name="daily_stats",
+        # Поиск по рассылке и владельцу покрывают составные индексы ниже
+        db_index=False,
+        verbose_name="Рассылка",
+    )
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        db_index=False,
+        verbose_name="Владелец",
+    )
+    date = models.DateField(verbose_name="Дата")
+    sent = models.PositiveIntegerField(default=0, verbose_name="Успешно")
+    failed = models.PositiveIntegerField(default=0, verbose_name="Не успешно")
+
+    class Meta:
+        verbose_name = "Статистика рассылки за день"
+        verbose_name_plural = "Статистика рассылок по дням"
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["mailing", "date"], name="unique_mailing_daily_stats"
+            ),
+        ]
+        indexes = [
+            # Сводка по владельцу за период
+            models.Index(fields=["owner", "date"], name="stats_owner_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.mailing_id} {self.date}: {self.sent}/{self.failed}"
+
+
+class MailingAttemptArchive(models.Model):
+    """Файл архива попыток за день: попытки старше срока хранения переносятся
+    из MailingAttempt в сжатый CSV (команда archive_attempts), итоги за эти
+    дни остаются в MailingDailyStats"""
+
+    date = models.DateField(verbose_name="Дата")
+    file = models.CharField(max_length=255, verbose_name="Файл")
+    rows = models.PositiveIntegerField(verbose_name="Попыток")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Перенесено")
+
+    class Meta:
+        verbose_name = "Архив попыток"
+        verbose_name_plural = "Архивы попыток"
+
+        indexes = [
+            models.Index(fields=["date"], name="attempt_archive_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: {self.file}"
+
+
+class MailingStatusChange(models.Model):
+    """История переходов статуса рассылки"""
+
+    mailing = models.ForeignKey(
+        Mailing,
+        on_delete=models.CASCADE,
+        related_name="status_history",
+        verbose_name="Рассылка",
+    )
+    from_status = models.CharField(
+        max_length=10, choices=Mailing.STATUS_CHOICES, verbose_name="Прежний статус"
+    )
+    to_status = models.CharField(
+        max_length=10, choices=Mailing.STATUS_CHOICES, verbose_name="Новый статус"
+    )
+    changed_at = models.DateTimeField(verbose_name="Время перехода")
+
+    class Meta:
+        verbose_name = "Переход статуса рассылки"
+        verbose_name_plural = "История статусов рассылок"
+
+    def __str__(self):
+        return f"{self.mailing_id}: {self.from_status} -> {self.to_status}"
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from django.db.models import Q
+
+# Разделитель времени и id в курсоре: в isoformat его быть не может
+CURSOR_SEPARATOR = "_"
+
+
+def encode_cursor(value, pk):
+    """Курсор на строку: время (например, попытки) и id для одинакового времени"""
+    return f"{value.isoformat()}{CURSOR_SEPARATOR}{pk}"
+
+
+def decode_cursor(value):
+    """(время, id) из курсора или None, если курсор пустой или испорчен"""
+    if not value:
+        return None
+    moment, _, pk = value.rpartition(CURSOR_SEPARATOR)
+    try:
+        return datetime.fromisoformat(moment), int(pk)
+    except ValueError:
+        return None
+
+
+def keyset_queryset(queryset, cursor, field="attempt_time"):
+    """Строки после курсора в порядке (field, id) по убыванию"""
+    queryset = queryset.order_by(f"-{field}", "-pk")
+    position = decode_cursor(cursor)
+    if position is not None:
+        value, pk = position
+        queryset = queryset.filter(
+            Q(**{f"{field}__lt": value}) | Q(**{field: value, "pk__lt": pk})
+        )
+    return queryset
+
+
+def keyset_page(queryset, cursor, page_size, field="attempt_time"):
+    """Страница строк после курсора.
+
+    В отличие от OFFSET, время выборки страницы не зависит от ее номера:
+    запрос продолжает с места по индексу. Возвращает (строки, курсор
+    следующей страницы или None)."""
+    rows = list(keyset_queryset(queryset, cursor, field)[: page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, field), last.pk)
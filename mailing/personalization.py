@@ -0,0 +1,58 @@
+import re
+
+# Поля получателя, которые можно подставить в тему и текст сообщения.
+# Значения приходят в шарде журнала доставки вместе с адресом
+PLACEHOLDERS = {
+    "email": "Email",
+    "full_name": "Ф.И.О.",
+}
+
+PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+def unknown_placeholders(text):
+    """Поля {{ ... }} в тексте, которых нет среди PLACEHOLDERS"""
+    return sorted(
+        {
+            match.group(1)
+            for match in PLACEHOLDER_RE.finditer(text)
+            if match.group(1) not in PLACEHOLDERS
+        }
+    )
+
+
+class Template:
+    """Шаблон персонализации вида "Здравствуйте, {{ full_name }}!".
+
+    Текст разбирается один раз и компилируется в строку формата str.format,
+    поэтому подстановка для получателя - один вызов format без разбора
+    шаблона и без шаблонизатора Django. Неизвестные поля остаются в тексте
+    как есть."""
+
+    def __init__(self, text):
+        self.text = text
+        self.fields = set()
+        parts = []
+        last = 0
+        for match in PLACEHOLDER_RE.finditer(text):
+            name = match.group(1)
+            if name not in PLACEHOLDERS:
+                continue
+            parts.append(_escape(text[last : match.start()]))
+            parts.append(f"{{{name}}}")
+            self.fields.add(name)
+            last = match.end()
+        parts.append(_escape(text[last:]))
+        self._format = "".join(parts)
+
+    def render(self, recipient):
+        """Текст для получателя (объект с атрибутами email, full_name, ...)"""
+        if not self.fields:
+            return self.text
+        return self._format.format(
+            **{name: getattr(recipient, name, None) or "" for name in self.fields}
+        )
+
+
+def _escape(text):
+    return text.replace("{", "{{").replace("}", "}}")
@@ -0,0 +1,136 @@
+import logging
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# Корзина токенов хранится в хэше Redis: tokens, ts (время последнего
+# пополнения) и factor (текущая доля от настроенной скорости). Время берется
+# из Redis, чтобы часы разных серверов-обработчиков не влияли на лимит.
+# Возвращает, сколько секунд подождать до появления токена (0 - токен выдан).
+ACQUIRE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'factor')
+local factor = tonumber(data[3]) or 1
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+
+rate = rate * factor
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now),
+           'factor', tostring(factor))
+redis.call('EXPIRE', KEYS[1], 3600)
+return {tostring(wait), tostring(factor)}
+"""
+
+# Адаптация скорости: при ответе-ограничении сервера (4xx) скорость
+# уменьшается вдвое, после успешных отправок постепенно восстанавливается.
+ADAPT_SCRIPT = """
+local factor = tonumber(redis.call('HGET', KEYS[1], 'factor')) or 1
+if ARGV[1] == 'throttle' then
+    factor = math.max(tonumber(ARGV[2]), factor / 2)
+else
+    factor = math.min(1, factor + tonumber(ARGV[3]))
+end
+redis.call('HSET', KEYS[1], 'factor', tostring(factor))
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(factor)
+"""
+
+
+class RateLimiter:
+    """Ограничитель скорости отправки писем по SMTP-серверу и отправителю.
+
+    Лимиты (писем в минуту) задаются в MAILING_RATE_LIMITS и действуют
+    сразу для всех процессов-обработчиков, так как состояние хранится в Redis
+    из CACHES. Если Redis недоступен, письма отправляются без ограничения."""
+
+    def __init__(self):
+        self.limits = settings.MAILING_RATE_LIMITS
+        self.min_factor = settings.MAILING_RATE_MIN_FACTOR
+        self.recovery_step = settings.MAILING_RATE_RECOVERY_STEP
+        self._slowed_down = set()
+        self._redis = None
+        if any(self.limits.values()):
+            try:
+                self._redis = get_redis_connection("default")
+                self._acquire = self._redis.register_script(ACQUIRE_SCRIPT)
+                self._adapt = self._redis.register_script(ADAPT_SCRIPT)
+            except Exception as e:
+                logger.warning(f"Ограничение скорости отправки отключено: {e}")
+                self._redis = None
+
+    @property
+    def enabled(self):
+        return self._redis is not None
+
+    def _buckets(self, sender):
+        """Ключи корзин и скорости (токенов в секунду) для отправки письма"""
+        buckets = []
+        if self.limits.get("relay"):
+            buckets.append(
+                (f"ratelimit:relay:{settings.EMAIL_HOST}", self.limits["relay"] / 60)
+            )
+        if self.limits.get("sender"):
+            buckets.append((f"ratelimit:sender:{sender}", self.limits["sender"] / 60))
+        return buckets
+
+    def acquire(self, sender):
+        """Ждет, пока все корзины отправителя выдадут по токену"""
+        if self._redis is None:
+            return
+        for key, rate in self._buckets(sender):
+            while True:
+                try:
+                    wait, factor = self._acquire(keys=[key], args=[rate, max(1, rate)])
+                except Exception as e:
+                    logger.warning(f"Ошибка ограничителя скорости ({key}): {e}")
+                    break
+                if float(factor) < 1:
+                    self._slowed_down.add(key)
+                if float(wait) <= 0:
+                    break
+                time.sleep(float(wait))
+
+    def throttled(self, sender):
+        """Сервер ответил временным отказом 4xx - снижаем скорость"""
+        self._adjust(sender, "throttle")
+
+    def succeeded(self, sender):
+        """Письмо ушло - постепенно возвращаем скорость, если она была снижена"""
+        if self._slowed_down:
+            self._adjust(sender, "success")
+
+    def _adjust(self, sender, outcome):
+        if self._redis is None:
+            return
+        for key, _ in self._buckets(sender):
+            if outcome == "success" and key not in self._slowed_down:
+                continue
+            try:
+                factor = float(
+                    self._adapt(
+                        keys=[key], args=[outcome, self.min_factor, self.recovery_step]
+                    )
+                )
+            except Exception as e:
+                logger.warning(f"Ошибка ограничителя скорости ({key}): {e}")
+                continue
+            if factor < 1:
+                self._slowed_down.add(key)
+            else:
+                self._slowed_down.discard(key)
@@ -0,0 +1,191 @@
+import base64
+import binascii
+import re
+from email.policy import compat32
+from email.utils import formatdate, make_msgid
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.message import (RFC5322_EMAIL_LINE_LENGTH_LIMIT,
+                                      forbid_multi_line_headers,
+                                      sanitize_address)
+from django.core.mail.utils import DNS_NAME
+
+from .personalization import Template
+
+# Заголовки, которые различаются у писем одной рассылки
+PER_RECIPIENT_HEADERS = ("To", "Date", "Message-ID")
+# Заголовки, которые у персонализированного письма зависят от получателя
+PERSONALIZED_HEADERS = ("Subject", "Content-Transfer-Encoding")
+
+# Сериализация заголовков, как при mime.as_bytes(linesep="\r\n")
+HEADER_POLICY = compat32.clone(linesep="\r\n")
+# Байт в одном закодированном слове заголовка: "Subject: " и слово
+# укладываются в 78 символов строки
+HEADER_WORD_BYTES = 40
+NEWLINE_RE = re.compile(r"\r\n|\r|\n")
+
+
+def envelope_address(address, encoding):
+    """Простой ASCII-адрес уже пригоден для заголовка и конверта, разбор через
+    sanitize_address (самая дорогая часть сборки письма) нужен только для
+    адресов с именем или не-ASCII символами"""
+    if address.isascii() and not any(char in address for char in '<>",\r\n'):
+        return address
+    return sanitize_address(address, encoding)
+
+
+def encode_header(name, value):
+    """Заголовок с не-ASCII значением в виде base64-слов RFC 2047 (UTF-8) по
+    HEADER_WORD_BYTES байт, с переносом строки между словами. Email.header
+    кодирует посимвольно и на персонализированной теме медленнее в десятки раз"""
+    data = value.encode()
+    words = []
+    start = 0
+    while start < len(data):
+        end = start + HEADER_WORD_BYTES
+        # Не разрываем многобайтовый символ: граница слова - не байт продолжения
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1
+        words.append(b"=?utf-8?b?" + base64.b64encode(data[start:end]) + b"?=")
+        start = end
+    return name.encode() + b": " + b"\r\n ".join(words) + b"\r\n"
+
+
+class PreparedEmail:
+    """Готовое к отправке письмо одному получателю"""
+
+    def __init__(self, prepared, to, envelope_to, data, recipient=None):
+        self.prepared = prepared
+        self.recipient = recipient
+        self.from_email = prepared.from_email
+        self.to = [to]
+        # Адреса для команд MAIL FROM / RCPT TO, как их готовит SMTP-бэкенд Django
+        self.envelope_from = prepared.envelope_from
+        self.envelope_to = [envelope_to]
+        self.data = data
+
+    def as_email_message(self):
+        """Обычное EmailMessage - для бэкендов без SMTP (locmem, console)"""
+        return self.prepared.build_email_message(self.to[0], self.recipient)
+
+
+class PreparedMessage:
+    """MIME-представление сообщения, собранное один раз на запуск рассылки.
+
+    Тело и общие заголовки сериализуются и кодируются один раз, для каждого
+    получателя к готовым байтам добавляются только To, Date и Message-ID.
+
+    Если в теме или тексте есть поля персонализации ({{ full_name }}),
+    шаблоны компилируются один раз, а для получателя подставляются значения
+    и кодируются только тема и тело - остальные заголовки готовы заранее."""
+
+    def __init__(self, message, from_email=None):
+        self.subject = message.subject
+        self.body = message.body
+        # Отправитель по умолчанию, как у EmailMessage; EMAIL_HOST_USER -
+        # для установок, где DEFAULT_FROM_EMAIL не задан
+        self.from_email = (
+            from_email or settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER
+        )
+        self.encoding = settings.DEFAULT_CHARSET
+        self.envelope_from = envelope_address(self.from_email, self.encoding)
+
+        self.subject_template = Template(self.subject)
+        self.body_template = Template(self.body)
+        self.personalized = bool(
+            self.subject_template.fields or self.body_template.fields
+        )
+        if self.personalized:
+            mime = self.build_email_message("").message()
+            for header in PER_RECIPIENT_HEADERS + PERSONALIZED_HEADERS:
+                del mime[header]
+            # Только общие заголовки, без тела
+            headers = mime.as_bytes(linesep="\r\n")
+            self._headers = headers[: headers.index(b"\r\n\r\n") + 2]
+            if not self.subject_template.fields:
+                self._subject_header = self._encode_subject(self.subject)
+        else:
+            self._payload = self._serialize(self.subject, self.body)
+
+    def build_email_message(self, to, recipient=None):
+        subject, body = self.subject, self.body
+        if recipient is not None and self.personalized:
+            subject, body = self.personalize(recipient)
+        return EmailMessage(
+            subject=subject,
+            body=body,
+            from_email=self.from_email,
+            to=[to] if to else [],
+        )
+
+    def personalize(self, recipient):
+        """Тема и текст письма получателю recipient"""
+        subject = self.subject_template.render(recipient)
+        if "\n" in subject or "\r" in subject:
+            # Перевод строки из поля получателя не должен разорвать заголовок
+            subject = " ".join(subject.splitlines())
+        return subject, self.body_template.render(recipient)
+
+    def _serialize(self, subject, body):
+        """Письмо без заголовков получателя целиком через email.mime"""
+        email_message = EmailMessage(
+            subject=subject, body=body, from_email=self.from_email
+        )
+        mime = email_message.message()
+        for header in PER_RECIPIENT_HEADERS:
+            del mime[header]
+        return mime.as_bytes(linesep="\r\n")
+
+    def _encode_subject(self, subject):
+        if not subject.isascii() and self.encoding.lower() == "utf-8":
+            return encode_header("Subject", subject)
+        _, value = forbid_multi_line_headers("Subject", subject, self.encoding)
+        return HEADER_POLICY.fold_binary("Subject", value)
+
+    def _personalized_payload(self, recipient):
+        """Заголовки и тело персонализированного письма так же, как их
+        собирает email.mime, но без сборки MIME-объекта на получателя"""
+        subject, body = self.personalize(recipient)
+        if self.subject_template.fields:
+            subject_header = self._encode_subject(subject)
+        else:
+            subject_header = self._subject_header
+
+        if "\r" in body:
+            body = NEWLINE_RE.sub("\r\n", body)
+        else:
+            body = body.replace("\n", "\r\n")
+        data = body.encode()
+        if max(map(len, data.split(b"\r\n"))) > RFC5322_EMAIL_LINE_LENGTH_LIMIT:
+            # Длинные строки, как и Django, кодируем quoted-printable
+            encoding = b"quoted-printable"
+            data = binascii.b2a_qp(data, istext=True)
+        else:
+            encoding = b"7bit" if body.isascii() else b"8bit"
+        return (
+            b"Content-Transfer-Encoding: "
+            + encoding
+            + b"\r\n"
+            + subject_header
+            + self._headers
+            + b"\r\n"
+            + data
+        )
+
+    def render(self, to, recipient=None):
+        """Письмо получателю to: свои заголовки + общие готовые байты.
+        recipient - поля для персонализации (email, full_name, ...)"""
+        envelope_to = envelope_address(to, self.encoding)
+        headers = (
+            f"To: {envelope_to}\r\n"
+            f"Date: {formatdate(localtime=settings.EMAIL_USE_LOCALTIME)}\r\n"
+            f"Message-ID: {make_msgid(domain=DNS_NAME)}\r\n"
+        )
+        if self.personalized:
+            payload = self._personalized_payload(recipient)
+        else:
+            payload = self._payload
+        return PreparedEmail(
+            self, to, envelope_to, headers.encode() + payload, recipient
+        )
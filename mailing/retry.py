@@ -0,0 +1,25 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+
+from .smtp import smtp_error_code
+
+
+def is_permanent(error):
+    """Постоянный отказ 5xx (адреса не существует, письмо отклонено политикой
+    сервера и т.п.) - повторять отправку бессмысленно. Временные отказы 4xx
+    и сетевые ошибки повторяются."""
+    code = smtp_error_code(error)
+    return code is not None and 500 <= code < 600
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой после attempts неудачных:
+    экспоненциальный рост от MAILING_RETRY_DELAY до MAILING_RETRY_MAX_DELAY
+    со случайным разбросом, чтобы повторы не приходили на сервер волной"""
+    delay = min(
+        settings.MAILING_RETRY_MAX_DELAY,
+        settings.MAILING_RETRY_DELAY * 2 ** max(0, attempts - 1),
+    )
+    return timedelta(seconds=random.uniform(delay / 2, delay))
@@ -0,0 +1,100 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .archiving import archived_days
+from .models import MailingAttempt, MailingDailyStats
+
+
+def record_attempts(attempts):
+    """Прибавляет записанные попытки к сводке по рассылкам и дням.
+
+    Вызывается в транзакции записи пачки попыток: на каждую пару
+    (рассылка, день) в пачке - одно UPDATE с F()-инкрементом, строки сводки
+    заводятся заранее через INSERT ... ON CONFLICT DO NOTHING."""
+    sent = Counter()
+    failed = Counter()
+    owners = {}
+    for attempt in attempts:
+        key = (attempt.mailing_id, timezone.localdate(attempt.attempt_time))
+        owners[key] = attempt.mailing.owner_id
+        if attempt.status == "Успешно":
+            sent[key] += 1
+        else:
+            failed[key] += 1
+    if not owners:
+        return
+
+    # Одинаковый порядок блокировки строк во всех потоках - без взаимоблокировок
+    keys = sorted(owners)
+    MailingDailyStats.objects.bulk_create(
+        [
+            MailingDailyStats(
+                mailing_id=mailing_id, date=date, owner_id=owners[mailing_id, date]
+            )
+            for mailing_id, date in keys
+        ],
+        ignore_conflicts=True,
+    )
+    for mailing_id, date in keys:
+        MailingDailyStats.objects.filter(mailing_id=mailing_id, date=date).update(
+            sent=F("sent") + sent[mailing_id, date],
+            failed=F("failed") + failed[mailing_id, date],
+        )
+
+
+def rebuild_rollups(mailing_ids=None, batch_size=1000):
+    """Пересчитывает сводку из MailingAttempt (всю или по списку рассылок).
+    Возвращает число строк сводки.
+
+    Дни, для которых есть запись MailingAttemptArchive, не пересчитываются:
+    часть их попыток уже удалена из базы, и их сводка остается как есть.
+    Это касается и попыток, записанных за такой день после архивирования
+    (задним числом): они учтены в сводке при записи, но пересчет их не
+    проверит. Остальные дни, в том числе более ранние дни без архива,
+    пересчитываются полностью."""
+    attempts = MailingAttempt.objects.annotate(date=TruncDate("attempt_time"))
+    stats = MailingDailyStats.objects.all()
+    if mailing_ids:
+        attempts = attempts.filter(mailing_id__in=mailing_ids)
+        stats = stats.filter(mailing_id__in=mailing_ids)
+    archived = archived_days()
+    if archived:
+        attempts = attempts.exclude(date__in=archived)
+        stats = stats.exclude(date__in=archived)
+
+    rows = (
+        attempts.values("mailing_id", "mailing__owner_id", "date")
+        .annotate(
+            sent=Count("pk", filter=Q(status="Успешно")),
+            failed=Count("pk", filter=~Q(status="Успешно")),
+        )
+        .order_by()
+    )
+    with transaction.atomic():
+        stats.delete()
+        created = MailingDailyStats.objects.bulk_create(
+            (
+                MailingDailyStats(
+                    mailing_id=row["mailing_id"],
+                    owner_id=row["mailing__owner_id"],
+                    date=row["date"],
+                    sent=row["sent"],
+                    failed=row["failed"],
+                )
+                for row in rows.iterator()
+            ),
+            batch_size=batch_size,
+        )
+    return len(created)
+
+
+def stats_totals(queryset):
+    """Суммы успешных и неуспешных попыток по строкам сводки"""
+    return queryset.aggregate(
+        sent=Coalesce(Sum("sent"), Value(0)),
+        failed=Coalesce(Sum("failed"), Value(0)),
+    )
@@ -1,39 +1,199 @@
+import heapq
 import logging
+import threading
+import time
 
-from apscheduler.schedulers.background import BackgroundScheduler
 from django.conf import settings
-from django_apscheduler.jobstores import DjangoJobStore, register_events
+from django.db import connection
+from django.utils import timezone
+from django_redis import get_redis_connection
 
+from mailing.models import Mailing
 from mailing.services import process_mailings
+from mailing.signals import SCHEDULE_CHANNEL
 
 logger = logging.getLogger(__name__)
 
 
-def mailing_job():
+def mailing_job(max_workers=None, per_mailing=None, use_async=None, connections=None):
     print("Запуск задачи рассылки...")  # для отладки
-    process_mailings()
+    process_mailings(max_workers, per_mailing, use_async, connections)
     print("Задача рассылки завершена.")
 
 
-def start_scheduler():
-    """Главная функция запуска планировщика"""
-    scheduler = BackgroundScheduler(timezone=settings.TIME_ZONE)
-    scheduler.add_jobstore(DjangoJobStore(), "default")
-
-    scheduler.add_job(
-        mailing_job,
-        trigger="interval",  # тип триггера интервал
-        minutes=1,  # интервал 1 минута
-        id="mailing_job",  # уникальный ID задачи
-        max_instances=1,
-        replace_existing=True,
-    )
-    logger.info("Задача рассылки добавлена в планировщик.")
+class ScheduleListener(threading.Thread):
+    """Слушает канал Redis с уведомлениями об изменении рассылок"""
+
+    def __init__(self, callback):
+        super().__init__(name="mailing-schedule-listener", daemon=True)
+        self.callback = callback
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                pubsub = get_redis_connection("default").pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(SCHEDULE_CHANNEL)
+                while not self._stopped.is_set():
+                    if pubsub.get_message(timeout=1.0):
+                        self.callback()
+                pubsub.close()
+            except Exception as e:
+                # Без Redis планировщик все равно перечитывает расписание
+                # раз в MAILING_SCHEDULER_RESYNC_INTERVAL секунд
+                logger.warning(f"Нет подписки на изменения рассылок: {e}")
+                self._stopped.wait(30)
+
+
+class MailingScheduler:
+    """Планировщик рассылок, работающий по событиям.
+
+    Держит в памяти очередь с приоритетом из ближайших событий рассылок
+    (first_send_time - начало, end_time - окончание) и спит до ближайшего
+    из них. При сохранении или удалении рассылки в любом процессе приходит
+    уведомление через Redis, и расписание перечитывается из БД. Пока есть
+    активные рассылки, тик выполняется раз в MAILING_ACTIVE_TICK_INTERVAL
+    секунд - для повторных попыток и новых получателей."""
+
+    def __init__(
+        self, max_workers=None, per_mailing=None, use_async=None, connections=None
+    ):
+        self.max_workers = max_workers
+        self.per_mailing = per_mailing
+        self.use_async = use_async
+        self.connections = connections
+        self._events = []
+        self._active = set()
+        self._last_tick = None
+        self._last_reload = None
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="mailing-scheduler", daemon=True
+        )
+        self._listener = ScheduleListener(self.wake)
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def start(self):
+        self._listener.start()
+        self._thread.start()
+
+    def wake(self):
+        """Расписание изменилось - перечитать его и выполнить тик"""
+        self._changed.set()
+
+    def shutdown(self, wait=True):
+        self._stopped.set()
+        self._listener.stop()
+        self._changed.set()
+        if wait:
+            self._thread.join()
 
+    def _reload(self, now):
+        """Заново строит очередь событий по незавершенным рассылкам"""
+        self._events = []
+        self._active = set()
+        mailings = Mailing.objects.filter(
+            status__in=["Создана", "Запущена"], end_time__gte=now
+        ).values_list("pk", "first_send_time", "end_time")
+
+        for pk, first_send_time, end_time in mailings:
+            if first_send_time > now:
+                self._events.append((first_send_time, pk, "start"))
+            else:
+                self._active.add(pk)
+            self._events.append((end_time, pk, "end"))
+
+        heapq.heapify(self._events)
+        self._last_reload = time.monotonic()
+
+    def _pop_due(self, now):
+        """Снимает с очереди наступившие события, возвращает True, если они были"""
+        due = False
+        while self._events and self._events[0][0] <= now:
+            _, pk, kind = heapq.heappop(self._events)
+            if kind == "start":
+                self._active.add(pk)
+            else:
+                self._active.discard(pk)
+            due = True
+        return due
+
+    def _timeout(self, now):
+        """Сколько секунд спать до следующего события"""
+        timeouts = [
+            settings.MAILING_SCHEDULER_RESYNC_INTERVAL
+            - (time.monotonic() - self._last_reload)
+        ]
+        if self._events:
+            timeouts.append((self._events[0][0] - now).total_seconds())
+        if self._active:
+            timeouts.append(
+                settings.MAILING_ACTIVE_TICK_INTERVAL
+                - (time.monotonic() - self._last_tick)
+            )
+        return max(0, min(timeouts))
+
+    def _run(self):
+        changed = True
+        while not self._stopped.is_set():
+            try:
+                now = timezone.now()
+                resync_due = (
+                    self._last_reload is None
+                    or time.monotonic() - self._last_reload
+                    >= settings.MAILING_SCHEDULER_RESYNC_INTERVAL
+                )
+                if changed or resync_due:
+                    self._reload(now)
+
+                due = self._pop_due(now)
+                poll_due = self._active and (
+                    self._last_tick is None
+                    or time.monotonic() - self._last_tick
+                    >= settings.MAILING_ACTIVE_TICK_INTERVAL
+                )
+                if changed or due or poll_due:
+                    mailing_job(
+                        self.max_workers,
+                        self.per_mailing,
+                        self.use_async,
+                        self.connections,
+                    )
+                    self._last_tick = time.monotonic()
+                    now = timezone.now()
+                    self._pop_due(now)
+
+                timeout = self._timeout(now)
+            except Exception as e:
+                logger.error(f"Ошибка планировщика рассылок: {e}")
+                timeout = settings.MAILING_ACTIVE_TICK_INTERVAL
+            finally:
+                # Поток живет долго - не держим соединение с БД во время сна
+                connection.close()
+
+            changed = self._changed.wait(timeout)
+            self._changed.clear()
+
+
+def start_scheduler(
+    max_workers=None, per_mailing=None, use_async=None, connections=None
+):
+    """Главная функция запуска планировщика"""
+    scheduler = MailingScheduler(max_workers, per_mailing, use_async, connections)
     try:
         logger.info("Запуск планировщика...")
-        register_events(scheduler)
         scheduler.start()
     except Exception as e:
         logger.error(f"Ошибка запуска планировщика: {e}")
-        scheduler.shutdown()
+        scheduler.shutdown(wait=False)
+
+    return scheduler
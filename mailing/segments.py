@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Recipient, Segment
+
+
+def refresh_sizes(segment_ids):
+    """Пересчитывает сохраненное число участников сегментов одним UPDATE
+    с подзапросом по индексу промежуточной таблицы (segment_id, recipient_id)"""
+    members = (
+        Segment.recipients.through.objects.filter(segment_id=OuterRef("pk"))
+        .order_by()
+        .values("segment_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Segment.objects.filter(pk__in=list(segment_ids)).update(
+        size=Coalesce(Subquery(members), 0)
+    )
+
+
+def delete_recipients(queryset):
+    """Удаляет получателей и пересчитывает размер их сегментов: каскадное
+    удаление участия в сегментах не вызывает m2m_changed"""
+    with transaction.atomic():
+        segment_ids = set(
+            Segment.recipients.through.objects.filter(
+                recipient_id__in=queryset.values("pk")
+            ).values_list("segment_id", flat=True)
+        )
+        deleted = queryset.delete()
+        refresh_sizes(segment_ids)
+    return deleted
+
+
+def delete_recipient(recipient):
+    """Удаляет одного получателя, см. delete_recipients"""
+    return delete_recipients(Recipient.objects.filter(pk=recipient.pk))
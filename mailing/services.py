@@ -1,71 +1,118 @@
 import logging
+import time
 
-from django.core.mail import send_mail
+from django.conf import settings
 from django.utils import timezone
 
-from config import settings
-
-from .models import Mailing, MailingAttempt
+from .async_smtp import SMTP_BACKEND
+from .attempts import AttemptWriter
+from .delivery import iter_claimed_deliveries, sync_deliveries
+from .dispatch import AsyncMailingDispatcher, MailingDispatcher, send_batch
+from .metrics import record_tick, stage
+from .models import Mailing
+from .rendering import PreparedMessage
+from .smtp import SmtpSession
+from .transitions import MailingStateMachine
+from .workers import run_in_processes
 
 logger = logging.getLogger(__name__)
 
 
-def _execute_send(mailing):
-    """Внутренняя функция: выполняет фактическую отправку писем и записывает попытки"""
-    recipients = mailing.recipients.all()
-    message = mailing.message
-
-    for recipient in recipients:
-        try:
-            send_mail(
-                subject=message.subject,
-                message=message.body,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[recipient.email],
-                fail_silently=False,
-            )
-            MailingAttempt.objects.create(
-                mailing=mailing,
-                status="Успешно",
-                server_response="Письмо отправлено",
-            )
-            logger.info(
-                f"Письмо для {recipient.email} (рассылка {mailing.pk}) отправлено."
-            )
-        except Exception as e:
-            MailingAttempt.objects.create(
-                mailing=mailing, status="Не успешно", server_response=str(e)
-            )
-            logger.error(
-                f"Ошибка отправки {recipient.email} (рассылка {mailing.pk}): {e}"
-            )
-
-    # Обновляем статус, если это был первый запуск
-    if mailing.status == "Создана":
-        mailing.status = "Запущена"
-        mailing.save()
-
-
-def send_mailing(mailing):
-    """Сервисная функция для отправки одной рассылки (используется планировщиком)"""
+def _execute_send(mailing, writer=None):
+    """Внутренняя функция: выполняет фактическую отправку писем и записывает попытки.
+    Письма уходят только получателям, ожидающим отправки по журналу доставки.
+    Возвращает количество обработанных получателей."""
+    if writer is None:
+        with AttemptWriter() as writer:
+            return _execute_send(mailing, writer)
+
+    sync_deliveries(mailing)
+
+    # Сообщение собирается в MIME один раз на весь запуск
+    with stage("message_build"):
+        prepared = PreparedMessage(mailing.message)
+    processed = 0
+
+    # Одно SMTP-соединение на весь запуск вместо нового на каждое письмо
+    with SmtpSession() as session:
+        # Сначала новые получатели, затем те, кому пора повторить отправку
+        for retries in (False, True):
+            for batch in iter_claimed_deliveries(mailing, retries=retries):
+                send_batch(mailing, prepared, batch, session, writer)
+                processed += len(batch)
+
+    # Первый запуск: "Создана" -> "Запущена"
+    MailingStateMachine().start([mailing.pk])
+    return processed
+
+
+def send_mailing(mailing, writer=None):
+    """Сервисная функция для отправки одной рассылки с проверкой времени"""
     now = timezone.now()
     # Проверка времени должна быть ТОЛЬКО здесь.
     if mailing.first_send_time <= now < mailing.end_time:
-        _execute_send(mailing)
+        _execute_send(mailing, writer)
+
 
+def _dispatcher(
+    max_workers=None, per_mailing=None, use_async=None, connections=None, sync=True
+):
+    """Пул потоков (MailingDispatcher) или цикл событий asyncio с пулом
+    SMTP-соединений (AsyncMailingDispatcher, MAILING_ASYNC_SMTP / use_async).
+    sync=False - не заводить журнал доставки, он уже заведен"""
+    if use_async is None:
+        use_async = settings.MAILING_ASYNC_SMTP
+    if use_async and settings.EMAIL_BACKEND != SMTP_BACKEND:
+        # Асинхронная отправка умеет только SMTP
+        logger.warning(
+            f"Асинхронная отправка недоступна для {settings.EMAIL_BACKEND}, "
+            "используется пул потоков"
+        )
+        use_async = False
+    if use_async:
+        return AsyncMailingDispatcher(connections, per_mailing, sync=sync)
+    return MailingDispatcher(max_workers, per_mailing, sync=sync)
 
-def process_mailings():
-    """Обрабатывает все активные рассылки"""
+
+def process_mailings(
+    max_workers=None, per_mailing=None, use_async=None, connections=None, workers=None
+):
+    """Обрабатывает все активные рассылки параллельно (см. MailingDispatcher и
+    AsyncMailingDispatcher), при workers > 1 - в нескольких процессах.
+    Возвращает словарь {pk рассылки: число обработанных получателей}.
+    Если упал процесс отправки - WorkerError, статусы рассылок в этом тике
+    не меняются (их поменяет следующий тик)"""
+    started = time.monotonic()
     now = timezone.now()
     # Ищем все рассылки, которые должны быть активны
-    active_mailings = Mailing.objects.filter(
-        status__in=["Создана", "Запущена"], first_send_time__lte=now, end_time__gte=now
-    )
+    with stage("active_query"):
+        active_mailings = list(
+            Mailing.objects.filter(
+                status__in=["Создана", "Запущена"],
+                first_send_time__lte=now,
+                end_time__gte=now,
+            ).select_related("message")
+        )
+
+    options = {
+        "max_workers": max_workers,
+        "per_mailing": per_mailing,
+        "use_async": use_async,
+        "connections": connections,
+    }
+    if workers and workers > 1:
+        # Журнал доставки заводится один раз здесь, процессы только
+        # забирают из него шарды получателей
+        for mailing in active_mailings:
+            sync_deliveries(mailing)
+        processed = run_in_processes(active_mailings, workers, **options)
+    else:
+        processed = _dispatcher(**options).run(active_mailings)
 
-    for mailing in active_mailings:
-        send_mailing(mailing)
+    # Статусы рассылок меняет только родительский процесс: запуск
+    # обработанных и завершение истекших - несколькими UPDATE на весь тик
+    with stage("status_transitions"):
+        MailingStateMachine(now).apply_tick([mailing.pk for mailing in active_mailings])
 
-    # Завершаем рассылки, у которых вышло время
-    Mailing.objects.filter(status="Запущена", end_time__lt=now).update(
-        status="Завершена"
-    )
+    record_tick(time.monotonic() - started, len(active_mailings))
+    return processed
@@ -0,0 +1,86 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save)
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+
+from .models import Mailing, Recipient, Segment
+from .segments import refresh_sizes
+from .stats import invalidate_stats
+
+logger = logging.getLogger(__name__)
+
+# Канал Redis, через который планировщики узнают об изменении расписания
+SCHEDULE_CHANNEL = "mailing:schedule"
+
+# Поля рассылки, по которым планировщик строит очередь событий
+SCHEDULE_FIELDS = ("first_send_time", "end_time", "status")
+
+
+def notify_schedule_changed():
+    """Будит планировщики рассылок во всех процессах"""
+    try:
+        get_redis_connection("default").publish(SCHEDULE_CHANNEL, "changed")
+    except Exception as e:
+        logger.warning(f"Не удалось уведомить планировщик об изменении: {e}")
+
+
+def _schedule(mailing):
+    # Через __dict__: отложенные поля (only/defer) не подгружаются запросом
+    return tuple(mailing.__dict__.get(field) for field in SCHEDULE_FIELDS)
+
+
+@receiver(post_init, sender=Mailing)
+def remember_schedule(sender, instance, **kwargs):
+    instance._saved_schedule = _schedule(instance)
+
+
+@receiver(post_save, sender=Mailing)
+def mailing_saved(sender, instance, created, **kwargs):
+    # Сохранение без изменения расписания (правка сообщения или аудитории)
+    # не будит планировщики
+    schedule = _schedule(instance)
+    if created or schedule != instance._saved_schedule:
+        transaction.on_commit(notify_schedule_changed)
+    instance._saved_schedule = schedule
+
+
+@receiver(post_delete, sender=Mailing)
+def mailing_deleted(sender, **kwargs):
+    transaction.on_commit(notify_schedule_changed)
+
+
+@receiver(post_save, sender=Mailing)
+@receiver(post_delete, sender=Mailing)
+@receiver(post_save, sender=Recipient)
+@receiver(post_delete, sender=Recipient)
+def stats_changed(sender, instance, **kwargs):
+    # Сброс после коммита, чтобы пересчет уже видел изменение
+    transaction.on_commit(lambda: invalidate_stats([instance.owner_id]))
+
+
+@receiver(m2m_changed, sender=Mailing.recipients.through)
+@receiver(m2m_changed, sender=Mailing.segments.through)
+@receiver(m2m_changed, sender=Segment.recipients.through)
+def mailing_recipients_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        transaction.on_commit(notify_schedule_changed)
+
+
+@receiver(m2m_changed, sender=Segment.recipients.through)
+def segment_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse - состав изменен со стороны получателя (recipient.segments)
+    if action == "pre_clear" and reverse:
+        instance._cleared_segment_ids = list(
+            instance.segments.values_list("pk", flat=True)
+        )
+    elif action in ("post_add", "post_remove"):
+        refresh_sizes(pk_set if reverse else [instance.pk])
+    elif action == "post_clear":
+        refresh_sizes(
+            instance.__dict__.pop("_cleared_segment_ids", [])
+            if reverse
+            else [instance.pk]
+        )
@@ -0,0 +1,124 @@
+import logging
+from smtplib import (SMTPRecipientsRefused, SMTPResponseException,
+                     SMTPServerDisconnected)
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from .metrics import SMTP_CONNECTIONS, stage
+from .ratelimit import RateLimiter
+from .rendering import PreparedEmail
+
+logger = logging.getLogger(__name__)
+
+
+def smtp_error_code(error):
+    """Код ответа SMTP-сервера из исключения или None для сетевых ошибок"""
+    if isinstance(error, SMTPResponseException):
+        return error.smtp_code
+    if isinstance(error, SMTPRecipientsRefused) and error.recipients:
+        # {адрес: (код, сообщение)} - берем код первого отклоненного адреса
+        return next(iter(error.recipients.values()))[0]
+    return None
+
+
+def is_throttling(error):
+    """Временный отказ 4xx: сервер просит снизить скорость или повторить позже"""
+    code = smtp_error_code(error)
+    return code is not None and 400 <= code < 500
+
+
+class SmtpSession:
+    """Одно SMTP-соединение на весь запуск рассылки.
+
+    Соединение открывается при первой отправке, переоткрывается после
+    MAILING_MAX_MESSAGES_PER_CONNECTION писем и при обрыве связи сервером."""
+
+    def __init__(self, max_messages=None):
+        self.max_messages = max_messages or settings.MAILING_MAX_MESSAGES_PER_CONNECTION
+        self.connection = None
+        self.sent_on_connection = 0
+        self.limiter = RateLimiter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        connection = get_connection(fail_silently=False)
+        with stage("smtp_connect"):
+            connection.open()
+        SMTP_CONNECTIONS.inc()
+        self.connection = connection
+        self.sent_on_connection = 0
+
+    def close(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.close()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии SMTP-соединения: {e}")
+        self.connection = None
+
+    def reconnect(self):
+        self.close()
+        self.open()
+
+    @stage("smtp_send")
+    def _deliver(self, email_message):
+        smtp = getattr(self.connection, "connection", None)
+        if isinstance(email_message, PreparedEmail):
+            if smtp is not None:
+                # Готовые байты уходят напрямую, без повторной сборки MIME
+                smtp.sendmail(
+                    email_message.envelope_from,
+                    email_message.envelope_to,
+                    email_message.data,
+                )
+                return
+            email_message = email_message.as_email_message()
+
+        email_message.connection = self.connection
+        email_message.send()
+
+    def send(self, email_message):
+        """Отправляет одно письмо (EmailMessage или PreparedEmail)
+        через текущее соединение"""
+        if self.connection is None or self.sent_on_connection >= self.max_messages:
+            self.reconnect()
+
+        sender = email_message.from_email
+        self.limiter.acquire(sender)
+        try:
+            try:
+                self._deliver(email_message)
+            except (SMTPServerDisconnected, ConnectionError) as e:
+                # Сервер закрыл соединение - переподключаемся и повторяем один раз
+                logger.warning(f"SMTP-соединение разорвано ({e}), переподключение...")
+                self.reconnect()
+                self._deliver(email_message)
+        except Exception as e:
+            if is_throttling(e):
+                logger.warning(f"Сервер ограничивает отправку ({e}), снижаем скорость")
+                self.limiter.throttled(sender)
+            raise
+
+        self.sent_on_connection += 1
+        self.limiter.succeeded(sender)
+
+    def send_batch(self, email_messages, progress=None):
+        """Отправляет пачку писем, возвращает список ошибок (None - успех).
+        progress вызывается после каждого письма"""
+        errors = []
+        for email_message in email_messages:
+            try:
+                self.send(email_message)
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+            if progress:
+                progress()
+        return errors
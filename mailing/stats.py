@@ -0,0 +1,59 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Mailing, MailingDailyStats, Recipient
+from .rollups import stats_totals
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_STATS_KEY = "stats:global"
+
+
+def owner_stats_key(owner_id):
+    return f"stats:owner:{owner_id}"
+
+
+def _compute_stats(owner_id=None):
+    mailings = Mailing.objects.all()
+    recipients = Recipient.objects.all()
+    daily_stats = MailingDailyStats.objects.all()
+    if owner_id is not None:
+        mailings = mailings.filter(owner_id=owner_id)
+        recipients = recipients.filter(owner_id=owner_id)
+        daily_stats = daily_stats.filter(owner_id=owner_id)
+    return {
+        "total_mailings": mailings.count(),
+        "active_mailings": mailings.filter(status="Запущена").count(),
+        "unique_recipients": recipients.count(),
+        # Попытки отправки - из сводки по дням, а не из MailingAttempt
+        **stats_totals(daily_stats),
+    }
+
+
+def get_stats(owner_id=None):
+    """Статистика главной страницы: общая (owner_id=None) или владельца.
+
+    Хранится в кэше, пока ее не сбросит invalidate_stats при изменении
+    рассылок, получателей или записи попыток; MAILING_STATS_CACHE_TIMEOUT -
+    только страховка от пропущенного сброса."""
+    key = GLOBAL_STATS_KEY if owner_id is None else owner_stats_key(owner_id)
+    stats = cache.get(key)
+    if stats is None:
+        stats = _compute_stats(owner_id)
+        cache.set(key, stats, settings.MAILING_STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate_stats(owner_ids=()):
+    """Сбрасывает общую статистику и статистику перечисленных владельцев.
+    Вызывается после коммита записи попыток и смены статусов: недоступный
+    кэш не должен прерывать отправку - статистика лишь устареет до
+    MAILING_STATS_CACHE_TIMEOUT"""
+    keys = [GLOBAL_STATS_KEY]
+    keys += [owner_stats_key(owner_id) for owner_id in set(owner_ids) if owner_id]
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning(f"Не удалось сбросить кэш статистики: {e}")
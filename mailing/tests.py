@@ -1 +1,775 @@
-# Create your tests here.
+import csv
+import email
+import email.policy
+import gzip
+import random
+import shutil
+import tempfile
+import threading
+from datetime import UTC, datetime, time, timedelta
+from pathlib import Path
+from smtplib import SMTPRecipientsRefused, SMTPResponseException
+from types import SimpleNamespace
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMessage
+from django.db import connection
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import User
+
+from .archiving import ARCHIVE_COLUMNS, archive_attempts
+from .attempts import AttemptWriter
+from .delivery import (LeaseKeeper, claim_deliveries, iter_claimed_deliveries,
+                       pending_deliveries, record_outcomes, sync_deliveries)
+from .forms import MailingForm
+from .models import (Mailing, MailingAttempt, MailingAttemptArchive,
+                     MailingDailyStats, MailingDelivery, Message, Recipient,
+                     Segment)
+from .pagination import keyset_page, keyset_queryset
+from .rendering import PreparedMessage
+from .retry import is_permanent, retry_delay
+from .rollups import rebuild_rollups, record_attempts
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN проверяется на PostgreSQL")
+class QueryPlanTests(TestCase):
+    """Планировщик PostgreSQL выбирает индексы для запросов планировщика
+    рассылок и страницы отчетов на большом объеме данных"""
+
+    OWNERS = 200
+    MAILINGS_PER_OWNER = 100
+    ATTEMPTS = 100_000
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(13)
+        now = timezone.now()
+        owners = User.objects.bulk_create(
+            [User(email=f"owner{i}@example.com") for i in range(cls.OWNERS)]
+        )
+        message = Message.objects.create(subject="Тема", body="Текст")
+
+        mailings = []
+        for owner in owners:
+            for _ in range(cls.MAILINGS_PER_OWNER):
+                # Как в рабочей базе: почти все рассылки давно завершены
+                if rng.random() < 0.01:
+                    status = rng.choice(["Создана", "Запущена"])
+                    start = now + timedelta(hours=rng.randint(-48, 48))
+                else:
+                    status = "Завершена"
+                    start = now - timedelta(days=rng.randint(2, 365))
+                mailings.append(
+                    Mailing(
+                        first_send_time=start,
+                        end_time=start + timedelta(days=1),
+                        status=status,
+                        message=message,
+                        owner=owner,
+                    )
+                )
+        mailings = Mailing.objects.bulk_create(mailings, batch_size=5000)
+
+        MailingAttempt.objects.bulk_create(
+            [
+                MailingAttempt(mailing=rng.choice(mailings), status="Успешно")
+                for _ in range(cls.ATTEMPTS)
+            ],
+            batch_size=5000,
+        )
+        cls.owner = owners[0]
+        cls.mailing = mailings[0]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"ANALYZE {Mailing._meta.db_table}, {MailingAttempt._meta.db_table}"
+            )
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_active_mailings_query(self):
+        # Выборка активных рассылок в process_mailings
+        now = timezone.now()
+        self.assertUsesIndex(
+            Mailing.objects.filter(
+                status__in=["Создана", "Запущена"],
+                first_send_time__lte=now,
+                end_time__gte=now,
+            ),
+            "mailing_active_idx",
+        )
+
+    def test_finished_mailings_query(self):
+        # Условие завершения рассылок с истекшим end_time
+        self.assertUsesIndex(
+            Mailing.objects.filter(status="Запущена", end_time__lt=timezone.now()),
+            "mailing_active_idx",
+        )
+
+    def test_scheduler_reload_query(self):
+        # Расписание планировщика: все незавершенные рассылки
+        self.assertUsesIndex(
+            Mailing.objects.filter(
+                status__in=["Создана", "Запущена"], end_time__gte=timezone.now()
+            ),
+            "mailing_active_idx",
+        )
+
+    def test_mailing_attempts_query(self):
+        self.assertUsesIndex(
+            MailingAttempt.objects.filter(mailing=self.mailing).order_by(
+                "-attempt_time"
+            )[:50],
+            "attempt_mailing_time_idx",
+        )
+
+    def test_owner_attempts_query(self):
+        # Страница отчетов для владельца рассылок
+        self.assertUsesIndex(
+            MailingAttempt.objects.filter(mailing__owner=self.owner),
+            "attempt_mailing_time_idx",
+        )
+
+    def test_all_attempts_page_query(self):
+        # Страница отчетов менеджера по курсору (attempt_time, id)
+        _, cursor = keyset_page(MailingAttempt.objects.all(), None, 50)
+        self.assertUsesIndex(
+            keyset_queryset(MailingAttempt.objects.all(), None)[:50],
+            "attempt_time_idx",
+        )
+        self.assertUsesIndex(
+            keyset_queryset(MailingAttempt.objects.all(), cursor)[:50],
+            "attempt_time_idx",
+        )
+
+
+class MailingTestCase(TestCase):
+    """Рассылка владельца с тремя отдельными получателями"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.owner = User.objects.create(email="owner@example.com")
+        cls.recipients = Recipient.objects.bulk_create(
+            [
+                Recipient(
+                    email=f"user{i}@example.com",
+                    full_name=f"Получатель {i}",
+                    owner=cls.owner,
+                )
+                for i in range(3)
+            ]
+        )
+        cls.mailing = Mailing.objects.create(
+            first_send_time=now - timedelta(hours=1),
+            end_time=now + timedelta(days=1),
+            status="Запущена",
+            message=Message.objects.create(subject="Тема", body="Текст"),
+            owner=cls.owner,
+        )
+        cls.mailing.recipients.set(cls.recipients)
+
+    def deliveries(self):
+        return MailingDelivery.objects.filter(mailing=self.mailing)
+
+
+class AttemptWriterTests(MailingTestCase):
+    """Буфер попыток записывается при заполнении и при выходе из with"""
+
+    def writer(self):
+        # Сброс только по размеру буфера или при выходе из контекста
+        return AttemptWriter(batch_size=100, flush_interval=3600)
+
+    def test_flush_on_exit(self):
+        sync_deliveries(self.mailing)
+        shard = claim_deliveries(self.mailing, 10)
+        with self.writer() as writer:
+            for row in shard:
+                writer.success(self.mailing, row)
+            self.assertEqual(MailingAttempt.objects.count(), 0)
+
+        self.assertEqual(
+            MailingAttempt.objects.filter(
+                mailing=self.mailing, status="Успешно"
+            ).count(),
+            len(shard),
+        )
+        self.assertFalse(self.deliveries().exclude(status="Доставлено").exists())
+
+    def test_flush_on_exception(self):
+        with self.assertRaises(RuntimeError):
+            with self.writer() as writer:
+                writer.failure(self.mailing, ConnectionError("Сеть недоступна"))
+                raise RuntimeError
+        self.assertEqual(MailingAttempt.objects.filter(status="Не успешно").count(), 1)
+
+    def test_flush_when_buffer_is_full(self):
+        writer = AttemptWriter(batch_size=2, flush_interval=3600)
+        writer.success(self.mailing)
+        self.assertEqual(MailingAttempt.objects.count(), 0)
+        writer.success(self.mailing)
+        self.assertEqual(MailingAttempt.objects.count(), 2)
+
+
+class DeliverySyncTests(MailingTestCase):
+    """Журнал доставки следует за аудиторией рассылки"""
+
+    def recipient_ids(self):
+        return set(self.deliveries().values_list("recipient_id", flat=True))
+
+    def test_sync_is_idempotent(self):
+        sync_deliveries(self.mailing)
+        sync_deliveries(self.mailing)
+        self.assertEqual(self.deliveries().count(), len(self.recipients))
+
+    def test_sync_after_recipient_swap(self):
+        sync_deliveries(self.mailing)
+        # Число получателей не меняется, меняется состав
+        newcomer = Recipient.objects.create(
+            email="new@example.com", full_name="Новый", owner=self.owner
+        )
+        self.mailing.recipients.remove(self.recipients[0])
+        self.mailing.recipients.add(newcomer)
+
+        sync_deliveries(self.mailing)
+        self.assertIn(newcomer.pk, self.recipient_ids())
+        pending = pending_deliveries(self.mailing).values_list(
+            "recipient_id", flat=True
+        )
+        self.assertNotIn(self.recipients[0].pk, pending)
+
+    def test_sync_after_segment_swap(self):
+        segment = Segment.objects.create(name="Сегмент", owner=self.owner)
+        segment.recipients.set(self.recipients[:2])
+        self.mailing.recipients.clear()
+        self.mailing.segments.add(segment)
+        sync_deliveries(self.mailing)
+
+        segment.recipients.remove(self.recipients[0])
+        segment.recipients.add(self.recipients[2])
+        sync_deliveries(self.mailing)
+        self.assertIn(self.recipients[2].pk, self.recipient_ids())
+
+    def test_recipient_in_several_segments(self):
+        first = Segment.objects.create(name="Первый", owner=self.owner)
+        second = Segment.objects.create(name="Второй", owner=self.owner)
+        first.recipients.set(self.recipients)
+        second.recipients.set(self.recipients)
+        self.mailing.segments.add(first, second)
+
+        sync_deliveries(self.mailing)
+        self.assertEqual(self.deliveries().count(), len(self.recipients))
+
+
+class DeliveryClaimTests(MailingTestCase):
+    """Аренда шардов: получатель выдается одному обработчику, пока аренда
+    не истекла или не снята записью результата"""
+
+    def setUp(self):
+        sync_deliveries(self.mailing)
+
+    def test_claimed_rows_are_not_claimed_again(self):
+        first = claim_deliveries(self.mailing, 2)
+        second = claim_deliveries(self.mailing, 10)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({row.pk for row in first} & {row.pk for row in second})
+        self.assertEqual(claim_deliveries(self.mailing, 10), [])
+
+    def test_expired_lease_is_claimed_again(self):
+        shard = claim_deliveries(self.mailing, 10)
+        later = timezone.now() + timedelta(seconds=settings.MAILING_CLAIM_LEASE + 1)
+        again = claim_deliveries(self.mailing, 10, now=later)
+        self.assertEqual([row.pk for row in again], [row.pk for row in shard])
+
+    def test_record_outcomes_releases_lease(self):
+        delivered, failed = claim_deliveries(self.mailing, 10)[:2]
+        record_outcomes([delivered], [(failed, "Сеть недоступна", False)])
+
+        for pk in (delivered.pk, failed.pk):
+            delivery = MailingDelivery.objects.get(pk=pk)
+            self.assertIsNone(delivery.claimed_by)
+            self.assertIsNone(delivery.lease_expires_at)
+        # Повторная попытка забирается после next_attempt_time, не дожидаясь
+        # истечения аренды
+        retry_at = MailingDelivery.objects.get(pk=failed.pk).next_attempt_time
+        retried = claim_deliveries(self.mailing, 10, retries=True, now=retry_at)
+        self.assertEqual([row.pk for row in retried], [failed.pk])
+
+    def test_lease_keeper_renews_unrecorded_rows(self):
+        lease = timedelta(seconds=settings.MAILING_CLAIM_LEASE)
+        # Шард забран почти целый срок аренды назад
+        claimed_at = timezone.now() - lease + timedelta(seconds=1)
+        sent, sending = claim_deliveries(self.mailing, 2, now=claimed_at)
+        record_outcomes([sent], [])
+
+        keeper = LeaseKeeper([sent, sending])
+        keeper.keep_alive()
+        self.assertLess(
+            MailingDelivery.objects.get(pk=sending.pk).lease_expires_at,
+            timezone.now() + timedelta(seconds=2),
+        )
+        keeper._renewed -= keeper.interval
+        keeper.keep_alive()
+
+        later = timezone.now() + timedelta(seconds=5)
+        self.assertEqual(
+            [row.pk for row in claim_deliveries(self.mailing, 10, now=later)],
+            [self.deliveries().exclude(pk__in=[sent.pk, sending.pk]).get().pk],
+        )
+        self.assertIsNone(MailingDelivery.objects.get(pk=sent.pk).claimed_by)
+
+
+@skipUnless(connection.vendor == "postgresql", "SKIP LOCKED проверяется на PostgreSQL")
+class ConcurrentClaimTests(TransactionTestCase):
+    """Параллельные обработчики делят получателей без пересечений"""
+
+    WORKERS = 4
+    RECIPIENTS = 200
+
+    def test_workers_claim_disjoint_shards(self):
+        now = timezone.now()
+        mailing = Mailing.objects.create(
+            first_send_time=now - timedelta(hours=1),
+            end_time=now + timedelta(days=1),
+            status="Запущена",
+            message=Message.objects.create(subject="Тема", body="Текст"),
+        )
+        mailing.recipients.set(
+            Recipient.objects.bulk_create(
+                [
+                    Recipient(email=f"user{i}@example.com", full_name=f"{i}")
+                    for i in range(self.RECIPIENTS)
+                ]
+            )
+        )
+        sync_deliveries(mailing)
+
+        barrier = threading.Barrier(self.WORKERS)
+        claimed = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for shard in iter_claimed_deliveries(mailing, chunk_size=10):
+                    claimed.extend(row.pk for row in shard)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(claimed), self.RECIPIENTS)
+        self.assertEqual(len(set(claimed)), self.RECIPIENTS)
+
+
+class RetryTests(MailingTestCase):
+    """Постоянные отказы 5xx отклоняются, временные повторяются с растущей
+    задержкой"""
+
+    def test_is_permanent(self):
+        self.assertTrue(is_permanent(SMTPResponseException(550, b"No such user")))
+        self.assertTrue(
+            is_permanent(SMTPRecipientsRefused({"a@example.com": (553, b"Denied")}))
+        )
+        self.assertFalse(is_permanent(SMTPResponseException(451, b"Try later")))
+        self.assertFalse(
+            is_permanent(SMTPRecipientsRefused({"a@example.com": (450, b"Busy")}))
+        )
+        self.assertFalse(is_permanent(ConnectionError("Сеть недоступна")))
+
+    @override_settings(MAILING_RETRY_DELAY=60, MAILING_RETRY_MAX_DELAY=600)
+    def test_retry_delay(self):
+        for attempts, delay in [(0, 60), (1, 60), (2, 120), (4, 480), (10, 600)]:
+            for _ in range(20):
+                seconds = retry_delay(attempts).total_seconds()
+                self.assertGreaterEqual(seconds, delay / 2)
+                self.assertLessEqual(seconds, delay)
+
+    @override_settings(MAILING_MAX_DELIVERY_ATTEMPTS=3)
+    def test_record_outcomes(self):
+        sync_deliveries(self.mailing)
+        transient, permanent, exhausted = claim_deliveries(self.mailing, 10)
+        exhausted = exhausted._replace(attempts=2)
+        now = timezone.now()
+        record_outcomes(
+            [],
+            [
+                (transient, "451 Try later", False),
+                (permanent, "550 No such user", True),
+                (exhausted, "451 Try later", False),
+            ],
+            now,
+        )
+
+        transient = MailingDelivery.objects.get(pk=transient.pk)
+        self.assertEqual(transient.status, "Ошибка")
+        self.assertEqual(transient.attempts, 1)
+        self.assertGreater(transient.next_attempt_time, now)
+        for row in (permanent, exhausted):
+            delivery = MailingDelivery.objects.get(pk=row.pk)
+            self.assertEqual(delivery.status, "Отклонено")
+            self.assertIsNone(delivery.next_attempt_time)
+
+
+class MetricsViewTests(TestCase):
+    """/metrics - только по токену или для сотрудников"""
+
+    def test_anonymous_without_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+    def test_staff(self):
+        self.client.force_login(
+            User.objects.create(email="s@example.com", is_staff=True)
+        )
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    @override_settings(MAILING_METRICS_TOKEN="secret")
+    def test_token(self):
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+
+
+class MailingFormTests(MailingTestCase):
+    """Рассылка без аудитории не сохраняется"""
+
+    def form(self, instance=None, **data):
+        now = timezone.now()
+        data = {
+            "first_send_time": now.strftime("%Y-%m-%dT%H:%M"),
+            "end_time": (now + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M"),
+            "message": self.mailing.message_id,
+            **data,
+        }
+        return MailingForm(data, instance=instance, owner=self.owner)
+
+    def test_empty_audience(self):
+        form = self.form()
+        self.assertFalse(form.is_valid())
+        self.assertIn("хотя бы один сегмент", str(form.non_field_errors()))
+
+    def test_recipients_or_segment(self):
+        self.assertTrue(self.form(add_recipients=self.recipients[0].email).is_valid())
+        segment = Segment.objects.create(name="Сегмент", owner=self.owner)
+        self.assertTrue(self.form(segments=[segment.pk]).is_valid())
+
+    def test_removing_all_recipients(self):
+        emails = "\n".join(recipient.email for recipient in self.recipients)
+        self.assertFalse(
+            self.form(instance=self.mailing, remove_recipients=emails).is_valid()
+        )
+        self.assertTrue(
+            self.form(
+                instance=self.mailing, remove_recipients=self.recipients[0].email
+            ).is_valid()
+        )
+
+
+class AttemptArchiveTests(MailingTestCase):
+    """Архив дня: файл с попытками без потери точности, удаление из базы,
+    запись MailingAttemptArchive и нетронутая сводка дня"""
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.day = timezone.localdate() - timedelta(days=200)
+        noon = timezone.make_aware(datetime.combine(self.day, time(12, 0, 0, 123456)))
+        attempts = MailingAttempt.objects.bulk_create(
+            [
+                MailingAttempt(
+                    mailing=self.mailing, status="Успешно", server_response="OK"
+                ),
+                MailingAttempt(
+                    mailing=self.mailing,
+                    status="Не успешно",
+                    server_response='451 Try later, "please"',
+                ),
+                MailingAttempt(mailing=self.mailing, status="Успешно"),
+            ]
+        )
+        # attempt_time заполняется auto_now_add: переносим первые две в прошлое
+        for offset, attempt in enumerate(attempts[:2]):
+            MailingAttempt.objects.filter(pk=attempt.pk).update(
+                attempt_time=noon + timedelta(seconds=offset)
+            )
+        self.old = list(
+            MailingAttempt.objects.filter(pk__in=[a.pk for a in attempts[:2]])
+            .order_by("pk")
+            .values_list("pk", "attempt_time", "status", "server_response")
+        )
+        record_attempts(MailingAttempt.objects.select_related("mailing"))
+
+    def day_stats(self):
+        return list(
+            MailingDailyStats.objects.filter(date=self.day).values_list(
+                "sent", "failed"
+            )
+        )
+
+    def test_archive_day_round_trip(self):
+        stats = self.day_stats()
+        self.assertEqual(stats, [(1, 1)])
+
+        archived = archive_attempts(days=180, directory=self.directory)
+        self.assertEqual(archived, [(self.day, 2)])
+
+        archive = MailingAttemptArchive.objects.get()
+        self.assertEqual((archive.date, archive.rows), (self.day, 2))
+        with gzip.open(self.directory / archive.file, "rt", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        header = list(ARCHIVE_COLUMNS.values())
+        header[0] = "\ufeff" + header[0]
+        self.assertEqual(rows[0], header)
+        self.assertEqual(
+            [
+                (int(pk), datetime.fromisoformat(at), status, response)
+                for pk, at, mailing_id, status, response in rows[1:]
+            ],
+            self.old,
+        )
+        self.assertTrue(rows[1][1].endswith(".123456+00:00"))
+
+        self.assertFalse(
+            MailingAttempt.objects.filter(pk__in=[pk for pk, *_ in self.old]).exists()
+        )
+        self.assertEqual(MailingAttempt.objects.count(), 1)
+
+        rebuild_rollups()
+        self.assertEqual(self.day_stats(), stats)
+
+
+def parse_email(data):
+    return email.message_from_bytes(data, policy=email.policy.default)
+
+
+class RenderingTestMixin:
+    """Сравнение готовых байтов PreparedMessage с письмом, которое собирает
+    EmailMessage.message() Django, после разбора обоих"""
+
+    HEADERS = (
+        "Subject",
+        "From",
+        "To",
+        "Content-Type",
+        "Content-Transfer-Encoding",
+        "MIME-Version",
+    )
+
+    def assertSameEmail(self, data, expected):
+        for line in data.split(b"\r\n"):
+            # Без одиночных CR/LF и строк длиннее предела RFC 5322
+            self.assertNotIn(b"\r", line)
+            self.assertNotIn(b"\n", line)
+            self.assertLessEqual(len(line), 998)
+        ours = parse_email(data)
+        theirs = parse_email(expected.message().as_bytes(linesep="\r\n"))
+        for header in self.HEADERS:
+            # Django при переносе длинной темы может добавить пробелы между
+            # закодированными словами: точное значение темы проверяют тесты
+            self.assertEqual(
+                " ".join(str(ours[header]).split()),
+                " ".join(str(theirs[header]).split()),
+                header,
+            )
+        self.assertEqual(ours.get_content(), theirs.get_content())
+        return ours
+
+
+class PersonalizedRenderingTests(RenderingTestMixin, SimpleTestCase):
+    """Персонализированное письмо: тема в RFC 2047, тело 8bit или
+    quoted-printable собираются без email.mime на каждого получателя"""
+
+    def render(self, subject, body, full_name, to="user@example.com"):
+        prepared = PreparedMessage(Message(subject=subject, body=body))
+        recipient = SimpleNamespace(email=to, full_name=full_name)
+        data = prepared.render(to, recipient).data
+        return data, prepared
+
+    def expected(self, prepared, subject, body, to="user@example.com"):
+        return EmailMessage(
+            subject=subject, body=body, from_email=prepared.from_email, to=[to]
+        )
+
+    def test_non_ascii_subject(self):
+        name = "Иванов Иван Иванович " * 5
+        data, prepared = self.render("{{ full_name }}, здравствуйте!", "Текст", name)
+        message = self.assertSameEmail(
+            data, self.expected(prepared, f"{name}, здравствуйте!", "Текст")
+        )
+        self.assertEqual(message["Subject"], f"{name}, здравствуйте!")
+
+    def test_long_lines(self):
+        body = "{{ full_name }}: " + "я" * 600 + "\n" + "a" * 1200
+        data, prepared = self.render("Тема", body, "Ж")
+        message = self.assertSameEmail(
+            data,
+            self.expected(prepared, "Тема", body.replace("{{ full_name }}", "Ж")),
+        )
+        self.assertEqual(message["Content-Transfer-Encoding"], "quoted-printable")
+
+    def test_line_breaks_in_body(self):
+        body = "Первая\r\nвторая\rтретья\nчетвертая {{ email }}"
+        data, prepared = self.render("Тема", body, "Ж")
+        self.assertSameEmail(
+            data,
+            self.expected(
+                prepared, "Тема", body.replace("{{ email }}", "user@example.com")
+            ),
+        )
+
+    def test_line_breaks_in_full_name(self):
+        # Перевод строки в поле получателя не добавляет заголовков
+        name = "Иван\r\nBcc: victim@example.com\nПетров"
+        data, prepared = self.render("{{ full_name }}", "{{ full_name }}", name)
+        message = self.assertSameEmail(
+            data,
+            self.expected(prepared, "Иван Bcc: victim@example.com Петров", name),
+        )
+        self.assertIsNone(message["Bcc"])
+
+    def test_ascii_full_name(self):
+        data, prepared = self.render("Hello, {{ full_name }}", "Hi", "John")
+        self.assertSameEmail(data, self.expected(prepared, "Hello, John", "Hi"))
+
+
+class MessagePlaceholderTests(SimpleTestCase):
+    def test_unknown_placeholders_rejected(self):
+        message = Message(subject="{{ name }}", body="{{ full_name }} {{ phone }}")
+        with self.assertRaises(ValidationError) as raised:
+            message.clean()
+        errors = raised.exception.message_dict
+        self.assertIn("name", errors["subject"][0])
+        self.assertIn("phone", errors["body"][0])
+
+    def test_known_placeholders_accepted(self):
+        Message(subject="{{ full_name }}", body="{{email}}").clean()
+
+
+@override_settings(DEFAULT_FROM_EMAIL="Рассылки <news@example.com>")
+class PreparedRenderingTests(RenderingTestMixin, SimpleTestCase):
+    """Письмо без персонализации: общие байты собраны один раз, на получателя
+    добавляются только To, Date и Message-ID"""
+
+    def assertSameAsDjango(self, subject, body, to):
+        prepared = PreparedMessage(Message(subject=subject, body=body))
+        self.assertFalse(prepared.personalized)
+        email_message = EmailMessage(subject=subject, body=body, to=[to])
+        return self.assertSameEmail(prepared.render(to).data, email_message)
+
+    def test_non_ascii_from_and_recipient_name(self):
+        message = self.assertSameAsDjango(
+            "Новости недели", "Текст письма", "Получатель <user@example.com>"
+        )
+        self.assertEqual(message["From"], "Рассылки <news@example.com>")
+        self.assertEqual(message["To"], "Получатель <user@example.com>")
+
+    def test_non_ascii_domain(self):
+        self.assertSameAsDjango("Тема", "Текст", "user@пример.рф")
+
+    def test_ascii_message(self):
+        self.assertSameAsDjango("News", "Hello\n" + "a" * 1200, "user@example.com")
+
+    def test_rendered_for_each_recipient(self):
+        prepared = PreparedMessage(Message(subject="Тема", body="Текст"))
+        first = parse_email(prepared.render("a@example.com").data)
+        second = parse_email(prepared.render("b@example.com").data)
+        self.assertEqual(
+            (first["To"], second["To"]), ("a@example.com", "b@example.com")
+        )
+        self.assertNotEqual(first["Message-ID"], second["Message-ID"])
+        self.assertEqual(first.get_content(), second.get_content())
+
+
+class AttemptPaginationTests(MailingTestCase):
+    """Страница отчетов: курсор (attempt_time, id) и фильтры формы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_mailing = Mailing.objects.create(
+            first_send_time=cls.mailing.first_send_time,
+            end_time=cls.mailing.end_time,
+            status="Запущена",
+            message=cls.mailing.message,
+            owner=cls.owner,
+        )
+        cls.moment = datetime(2024, 3, 10, 12, tzinfo=UTC)
+        attempts = MailingAttempt.objects.bulk_create(
+            [
+                MailingAttempt(
+                    mailing=cls.mailing if i % 2 else cls.other_mailing,
+                    status="Успешно" if i % 3 else "Не успешно",
+                )
+                for i in range(12)
+            ]
+        )
+        # Пять попыток с одним временем, остальные - по одной в день раньше
+        for i, attempt in enumerate(attempts):
+            MailingAttempt.objects.filter(pk=attempt.pk).update(
+                attempt_time=cls.moment - timedelta(days=max(i - 4, 0))
+            )
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+
+    def test_equal_times_across_pages(self):
+        seen = []
+        cursor = None
+        while True:
+            # По 3 строки: пять попыток с одним временем делятся между страницами
+            rows, cursor = keyset_page(MailingAttempt.objects.all(), cursor, 3)
+            seen.extend(row.pk for row in rows)
+            if cursor is None:
+                break
+        expected = MailingAttempt.objects.order_by("-attempt_time", "-pk")
+        self.assertEqual(seen, list(expected.values_list("pk", flat=True)))
+
+    def test_malformed_cursor_returns_first_page(self):
+        first = self.client.get(reverse("mailing:attempt_list"))
+        for cursor in ("garbage", "2024-13-01_1", "2024-03-10T12:00:00_x", "_"):
+            response = self.client.get(
+                reverse("mailing:attempt_list"), {"after": cursor}
+            )
+            self.assertEqual(response.status_code, 200, cursor)
+            self.assertEqual(
+                list(response.context["object_list"]),
+                list(first.context["object_list"]),
+                cursor,
+            )
+
+    def test_filters_applied(self):
+        response = self.client.get(
+            reverse("mailing:attempt_list"),
+            {
+                "status": "Успешно",
+                "mailing": self.mailing.pk,
+                "date_from": "2024-03-07",
+                "date_to": "2024-03-09",
+            },
+        )
+        rows = response.context["object_list"]
+        expected = MailingAttempt.objects.filter(
+            status="Успешно",
+            mailing=self.mailing,
+            attempt_time__gte=datetime(2024, 3, 7, tzinfo=UTC),
+            attempt_time__lt=datetime(2024, 3, 10, tzinfo=UTC),
+        ).order_by("-attempt_time", "-pk")
+        self.assertTrue(expected.exists())
+        self.assertEqual(list(rows), list(expected))
+        for row in rows:
+            self.assertEqual(row.status, "Успешно")
+            self.assertEqual(row.mailing_id, self.mailing.pk)
+            self.assertLess(row.attempt_time, self.moment - timedelta(hours=12))
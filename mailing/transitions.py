@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Mailing, MailingStatusChange
+from .stats import invalidate_stats
+
+
+class MailingStateMachine:
+    """Переходы статусов рассылок за один тик:
+    "Создана" -> "Запущена" после отправки, "Запущена" -> "Завершена"
+    по окончании end_time.
+
+    Каждый переход применяется ко всему множеству рассылок сразу:
+    строки-кандидаты блокируются (SELECT ... FOR UPDATE), статус меняется
+    одним UPDATE с условием на текущий статус (compare-and-set), история
+    пишется одним bulk_create. Меняется только столбец status, поэтому
+    параллельное редактирование рассылки не затирается, а рассылка, которую
+    уже перевел другой процесс, просто не попадает в выборку."""
+
+    def __init__(self, now=None):
+        self.now = now or timezone.now()
+        self.changes = []
+
+    def start(self, mailing_ids):
+        """Отмечает рассылки mailing_ids запущенными (если они еще "Созданы")"""
+        return self._apply(
+            Mailing.objects.filter(pk__in=mailing_ids), "Создана", "Запущена"
+        )
+
+    def finish_expired(self):
+        """Завершает запущенные рассылки, у которых вышло время"""
+        return self._apply(
+            Mailing.objects.filter(end_time__lt=self.now), "Запущена", "Завершена"
+        )
+
+    def apply_tick(self, started_ids):
+        """Все переходы тика в одной транзакции. Возвращает список
+        MailingStatusChange"""
+        with transaction.atomic():
+            self.start(started_ids)
+            self.finish_expired()
+        return self.changes
+
+    def _apply(self, queryset, from_status, to_status):
+        with transaction.atomic():
+            # Блокируем в порядке pk, чтобы параллельные тики не ждали друг
+            # друга по кругу
+            rows = list(
+                queryset.filter(status=from_status)
+                .select_for_update()
+                .order_by("pk")
+                .values_list("pk", "owner_id")
+            )
+            if not rows:
+                return []
+            mailing_ids = [pk for pk, _ in rows]
+            Mailing.objects.filter(pk__in=mailing_ids, status=from_status).update(
+                status=to_status
+            )
+            changes = MailingStatusChange.objects.bulk_create(
+                [
+                    MailingStatusChange(
+                        mailing_id=pk,
+                        from_status=from_status,
+                        to_status=to_status,
+                        changed_at=self.now,
+                    )
+                    for pk in mailing_ids
+                ]
+            )
+            # update() не вызывает сигналы: статистику владельцев сбрасываем
+            # сами, после коммита
+            owner_ids = {owner_id for _, owner_id in rows}
+            transaction.on_commit(lambda: invalidate_stats(owner_ids))
+
+        self.changes.extend(changes)
+        return changes
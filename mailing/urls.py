@@ -1,13 +1,16 @@
 from django.urls import path
 
 from . import views
-from .views import (HomePageView, MailingAttemptListView, MailingCreateView,
+from .views import (HomePageView, MailingAttemptExportView,
+                    MailingAttemptListView, MailingCreateView,
                     MailingDeleteView, MailingDetailView, MailingListView,
                     MailingUpdateView, MessageCreateView, MessageDeleteView,
                     MessageDetailView, MessageListView, MessageUpdateView,
                     RecipientCreateView, RecipientDeleteView,
-                    RecipientDetailView, RecipientListView,
-                    RecipientUpdateView)
+                    RecipientDetailView, RecipientExportView,
+                    RecipientImportView, RecipientListView,
+                    RecipientUpdateView, SegmentCreateView, SegmentDeleteView,
+                    SegmentDetailView, SegmentListView, SegmentUpdateView)
 
 app_name = "mailing"
 
@@ -35,6 +38,8 @@ urlpatterns = [
     path("recipient/", RecipientListView.as_view(), name="recipient_list"),
     path("recipient/<int:pk>/", RecipientDetailView.as_view(), name="recipient_detail"),
     path("recipient/create/", RecipientCreateView.as_view(), name="recipient_create"),
+    path("recipient/import/", RecipientImportView.as_view(), name="recipient_import"),
+    path("recipient/export/", RecipientExportView.as_view(), name="recipient_export"),
     path(
         "recipient/<int:pk>/update/",
         RecipientUpdateView.as_view(),
@@ -45,5 +50,16 @@ urlpatterns = [
         RecipientDeleteView.as_view(),
         name="recipient_delete",
     ),
+    path("segment/", SegmentListView.as_view(), name="segment_list"),
+    path("segment/<int:pk>/", SegmentDetailView.as_view(), name="segment_detail"),
+    path("segment/create/", SegmentCreateView.as_view(), name="segment_create"),
+    path(
+        "segment/<int:pk>/update/", SegmentUpdateView.as_view(), name="segment_update"
+    ),
+    path(
+        "segment/<int:pk>/delete/", SegmentDeleteView.as_view(), name="segment_delete"
+    ),
     path("reports/", MailingAttemptListView.as_view(), name="attempt_list"),
+    path("reports/export/", MailingAttemptExportView.as_view(), name="attempt_export"),
+    path("metrics", views.metrics, name="metrics"),
 ]
@@ -1,17 +1,29 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.cache import cache
-from django.http import Http404
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
-from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
-                                  TemplateView, UpdateView)
-
-from users.views import OwnerOrManagerTestMixin, OwnerRequiredMixin
-
-from .forms import MailingForm
-from .models import Mailing, MailingAttempt, Message, Recipient
+from django.utils.crypto import constant_time_compare
+from django.views.generic import (CreateView, DeleteView, DetailView, FormView,
+                                  ListView, TemplateView, UpdateView)
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from users.views import (OwnerOrManagerTestMixin, OwnerRequiredMixin,
+                         can_manage_object)
+
+from .archiving import archived_until
+from .exporting import ATTEMPT_COLUMNS, RECIPIENT_COLUMNS, csv_response
+from .forms import (AttemptFilterForm, MailingForm, RecipientImportForm,
+                    SegmentForm)
+from .importing import ImportFileError, import_recipients
+from .models import (Mailing, MailingAttempt, MailingDailyStats, Message,
+                     Recipient, Segment)
+from .pagination import keyset_page
+from .rollups import stats_totals
+from .segments import delete_recipient
 from .services import _execute_send
+from .stats import get_stats
 
 
 class HomePageView(TemplateView):
@@ -22,41 +34,16 @@ class HomePageView(TemplateView):
         user = self.request.user
 
         # Если пользователь неаутентифицирован или является менеджером / суперпользователем,
-        # используем глобальную (кэшированную) статистику
+        # используем глобальную статистику
         if (
             not user.is_authenticated
             or user.is_superuser
             or user.has_perm("mailing.can_view_all_mailings")
         ):
-            cached_data = cache.get("home_page_stats")
-
-            if cached_data is None:
-                # Если в кэше нет, считаем и кладем в кэш
-                cached_data = {
-                    "total_mailings": Mailing.objects.count(),
-                    "active_mailings": Mailing.objects.filter(
-                        status="Запущена"
-                    ).count(),
-                    # Используем distinct() для уникальных клиентов
-                    "unique_recipients": Recipient.objects.distinct().count(),
-                }
-                cache.set("home_page_stats", cached_data, 60 * 15)  # кэш на 15 минут
-
-            context.update(cached_data)
+            context.update(get_stats())
         # сли это обычный аутентифицир. пользователь - показываем его личную статистику
         else:
-            context.update(
-                {
-                    "total_mailings": Mailing.objects.filter(owner=user).count(),
-                    "active_mailings": Mailing.objects.filter(
-                        owner=user, status="Запущена"
-                    ).count(),
-                    # количество уникальных клиентов, созданных этим пользователем
-                    "unique_recipients": Recipient.objects.filter(owner=user)
-                    .distinct()
-                    .count(),
-                }
-            )
+            context.update(get_stats(owner_id=user.pk))
 
         return context
 
@@ -69,6 +56,21 @@ class MailingListView(LoginRequiredMixin, OwnerRequiredMixin, ListView):
 class MailingDetailView(LoginRequiredMixin, OwnerOrManagerTestMixin, DetailView):
     model = Mailing
     template_name = "mailing/mailing_detail.html"
+    # Сколько отдельных получателей показывать на странице рассылки
+    preview_size = 100
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["stats"] = stats_totals(self.object.daily_stats.all())
+        context["segments"] = self.object.segments.all()
+        # На одного больше, чем показываем: так видно, что список не полный
+        recipients = list(
+            self.object.recipients.order_by("pk")[: self.preview_size + 1]
+        )
+        context["recipients"] = recipients[: self.preview_size]
+        context["more_recipients"] = len(recipients) > self.preview_size
+        context["status_history"] = self.object.status_history.order_by("changed_at")
+        return context
 
 
 class MailingCreateView(LoginRequiredMixin, CreateView):
@@ -77,11 +79,16 @@ class MailingCreateView(LoginRequiredMixin, CreateView):
     form_class = MailingForm
     success_url = reverse_lazy("mailing:mailing_list")
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["owner"] = self.request.user
+        return kwargs
+
     def form_valid(self, form):
         self.object = form.save(commit=False)  # commit=False для привязки владельца
         self.object.owner = self.request.user
         self.object.save()
-        form.save_m2m()  # для сохранения ManyToMany для recipients
+        form.save_m2m()  # для сохранения ManyToMany для segments и recipients
         return redirect(self.success_url)
 
 
@@ -91,6 +98,26 @@ class MailingUpdateView(LoginRequiredMixin, OwnerOrManagerTestMixin, UpdateView)
     form_class = MailingForm
     success_url = reverse_lazy("mailing:mailing_list")
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        # Менеджер выбирает из сегментов и получателей владельца рассылки
+        kwargs["owner"] = self.object.owner_id
+        return kwargs
+
+    def form_valid(self, form):
+        # Статус меняет планировщик: сохраняем только поля формы, чтобы
+        # не вернуть статус, прочитанный до его перехода
+        self.object = form.save(commit=False)
+        self.object.save(
+            update_fields=[
+                field.name
+                for field in Mailing._meta.concrete_fields
+                if field.name in form.fields
+            ]
+        )
+        form.save_m2m()
+        return redirect(self.success_url)
+
 
 class MailingDeleteView(LoginRequiredMixin, OwnerOrManagerTestMixin, DeleteView):
     model = Mailing
@@ -140,6 +167,20 @@ class RecipientListView(LoginRequiredMixin, OwnerRequiredMixin, ListView):
     template_name = "mailing/recipient_list.html"
 
 
+class RecipientExportView(LoginRequiredMixin, OwnerRequiredMixin, ListView):
+    """Потоковая CSV-выгрузка получателей (свои или все для менеджера)"""
+
+    model = Recipient
+
+    def get(self, request, *args, **kwargs):
+        return csv_response(
+            self.get_queryset().order_by("pk"),
+            RECIPIENT_COLUMNS,
+            "recipients.csv",
+            compress=request.GET.get("gzip") == "1",
+        )
+
+
 class RecipientDetailView(LoginRequiredMixin, OwnerOrManagerTestMixin, DetailView):
     model = Recipient
     template_name = "mailing/recipient_detail.html"
@@ -159,6 +200,32 @@ class RecipientCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
+class RecipientImportView(LoginRequiredMixin, FormView):
+    template_name = "mailing/recipient_import.html"
+    form_class = RecipientImportForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["owner"] = self.request.user
+        return kwargs
+
+    def form_valid(self, form):
+        try:
+            report = import_recipients(
+                form.cleaned_data["file"],
+                form.cleaned_data["file"].name,
+                owner=self.request.user,
+                mailing=form.cleaned_data["mailing"],
+                segment=form.cleaned_data["segment"],
+                encoding=form.cleaned_data["encoding"],
+            )
+        except ImportFileError as e:
+            form.add_error("file", str(e))
+            return self.form_invalid(form)
+        # Итоги и ошибки по строкам показываем на той же странице
+        return self.render_to_response(self.get_context_data(form=form, report=report))
+
+
 class RecipientUpdateView(LoginRequiredMixin, OwnerOrManagerTestMixin, UpdateView):
     model = Recipient
     template_name = "mailing/recipient_form.html"
@@ -171,17 +238,134 @@ class RecipientDeleteView(LoginRequiredMixin, OwnerOrManagerTestMixin, DeleteVie
     template_name = "mailing/recipient_confirm_delete.html"
     success_url = reverse_lazy("mailing:recipient_list")
 
+    def form_valid(self, form):
+        # Вместе с получателем уменьшается размер его сегментов
+        delete_recipient(self.object)
+        return redirect(self.success_url)
+
+
+class SegmentListView(LoginRequiredMixin, OwnerRequiredMixin, ListView):
+    model = Segment
+    template_name = "mailing/segment_list.html"
+
+
+class SegmentDetailView(LoginRequiredMixin, OwnerOrManagerTestMixin, DetailView):
+    model = Segment
+    template_name = "mailing/segment_detail.html"
+    # Сколько участников показывать на странице сегмента
+    preview_size = 100
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["size"] = self.object.size
+        context["preview"] = self.object.recipients.order_by("pk")[: self.preview_size]
+        context["mailings"] = self.object.mailings.select_related("message")
+        return context
+
+
+class SegmentCreateView(LoginRequiredMixin, CreateView):
+    model = Segment
+    template_name = "mailing/segment_form.html"
+    form_class = SegmentForm
+    success_url = reverse_lazy("mailing:segment_list")
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["owner"] = self.request.user
+        return kwargs
+
+    def form_valid(self, form):
+        self.object = form.save(commit=False)
+        self.object.owner = self.request.user
+        self.object.save()
+        form.save_m2m()
+        return redirect(self.success_url)
+
+
+class SegmentUpdateView(LoginRequiredMixin, OwnerOrManagerTestMixin, UpdateView):
+    model = Segment
+    template_name = "mailing/segment_form.html"
+    form_class = SegmentForm
+    success_url = reverse_lazy("mailing:segment_list")
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["owner"] = self.object.owner_id
+        return kwargs
+
+
+class SegmentDeleteView(LoginRequiredMixin, OwnerOrManagerTestMixin, DeleteView):
+    model = Segment
+    template_name = "mailing/segment_confirm_delete.html"
+    success_url = reverse_lazy("mailing:segment_list")
+
 
 class MailingAttemptListView(LoginRequiredMixin, ListView):
     model = MailingAttempt
     template_name = "mailing/attempt_list.html"
+    page_size = 50
 
-    def get_queryset(self):
+    def get_attempts(self):
+        """Попытки, доступные пользователю, с фильтрами формы. Заодно готовит
+        выборку сводки по дням с теми же фильтрами (self.stats_queryset)"""
         # Отчеты только по своим рассылкам (или все для менеджера)
         user = self.request.user
         if user.has_perm("mailing.can_view_all_mailings"):
-            return MailingAttempt.objects.all()
-        return MailingAttempt.objects.filter(mailing__owner=user)
+            queryset = MailingAttempt.objects.all()
+            stats = MailingDailyStats.objects.all()
+        else:
+            queryset = MailingAttempt.objects.filter(mailing__owner=user)
+            stats = MailingDailyStats.objects.filter(owner=user)
+
+        self.filter_form = AttemptFilterForm(self.request.GET or None)
+        if self.filter_form.is_valid():
+            queryset = self.filter_form.filter(queryset)
+            stats = self.filter_form.filter_stats(stats)
+        self.stats_queryset = stats
+        return queryset
+
+    def get_queryset(self):
+        queryset = self.get_attempts()
+        # Итоги за выбранный период - из сводки по дням, без подсчета попыток
+        self.stats = stats_totals(self.stats_queryset)
+
+        # Рассылка и тема сообщения приходят тем же запросом, без запроса на строку.
+        # Постраничность по курсору (attempt_time, id) вместо OFFSET
+        attempts, self.next_cursor = keyset_page(
+            queryset.select_related("mailing__message"),
+            self.request.GET.get("after"),
+            self.page_size,
+        )
+        return attempts
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["filter_form"] = self.filter_form
+        context["stats"] = self.stats
+        context["archived_until"] = archived_until()
+
+        params = self.request.GET.copy()
+        params.pop("after", None)
+        context["first_page_url"] = (
+            f"?{params.urlencode()}" if "after" in self.request.GET else None
+        )
+        context["export_query"] = params.urlencode()
+        if self.next_cursor:
+            params["after"] = self.next_cursor
+            context["next_page_url"] = f"?{params.urlencode()}"
+        return context
+
+
+class MailingAttemptExportView(MailingAttemptListView):
+    """Потоковая CSV-выгрузка попыток с фильтрами страницы отчетов"""
+
+    def get(self, request, *args, **kwargs):
+        return csv_response(
+            self.get_attempts().select_related(None).order_by("-attempt_time", "-pk"),
+            ATTEMPT_COLUMNS,
+            "attempts.csv",
+            compress=request.GET.get("gzip") == "1",
+        )
 
 
 def manual_send(request, pk):
@@ -189,26 +373,30 @@ def manual_send(request, pk):
         return redirect("users:login")
 
     mailing = get_object_or_404(Mailing, pk=pk)
-    user = request.user
-
-    # Суперпользователь всегда имеет доступ
-    if user.is_superuser:
-        is_allowed = True
-    else:
-        # Проверка прав: Владелец ИЛИ Менеджер (can_disable_mailings)
-        is_owner = mailing.owner == user
-        can_disable = user.has_perm("mailing.can_disable_mailings")
 
-        # Менеджер, даже если он не владелец, должен иметь право отключения
-        is_allowed = is_owner or can_disable
-
-    if not is_allowed:
+    # Владелец или менеджер с правом отключения рассылок
+    if not can_manage_object(request.user, mailing):
         raise Http404
 
     try:
-        _execute_send(mailing)
-        messages.success(request, "Рассылка отправлена вручную.")
+        if _execute_send(mailing):
+            messages.success(request, "Рассылка отправлена вручную.")
+        else:
+            messages.info(request, "Нет получателей, ожидающих отправки.")
     except Exception as e:
         messages.error(request, f"Ошибка при ручной отправке: {e}")
 
     return redirect("mailing:mailing_detail", pk=pk)
+
+
+def metrics(request):
+    """Метрики Prometheus веб-процесса: по заголовку Authorization: Bearer
+    <MAILING_METRICS_TOKEN> или для сотрудника (is_staff). Без токена в
+    настройках метрики доступны только сотрудникам"""
+    token = settings.MAILING_METRICS_TOKEN
+    authorized = bool(token) and constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    )
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
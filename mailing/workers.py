@@ -0,0 +1,80 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerError(Exception):
+    """Процесс отправки завершился с ошибкой. processed - сколько получателей
+    успели обработать остальные процессы {pk рассылки: число}"""
+
+    def __init__(self, message, processed):
+        super().__init__(message)
+        self.processed = processed
+
+
+def _init_worker():
+    # Процессы пула запускаются заново (spawn), а не копией родителя:
+    # у каждого свои соединения с БД и SMTP, без унаследованных сокетов
+    django.setup()
+
+
+def _send_in_worker(mailing_ids, options):
+    """Рассылает получателей активных рассылок в процессе пула. Получателей
+    процессы делят между собой через аренду шардов (SKIP LOCKED)"""
+    # Модуль загружается в процессе пула до django.setup(), поэтому
+    # модели и сервисы импортируются уже при вызове
+    from django.db import connections
+
+    from .models import Mailing
+    from .services import _dispatcher
+
+    mailings = list(
+        Mailing.objects.filter(pk__in=mailing_ids).select_related("message")
+    )
+    try:
+        # Журнал доставки заведен родительским процессом
+        return _dispatcher(**options, sync=False).run(mailings)
+    finally:
+        connections.close_all()
+
+
+def run_in_processes(mailings, workers, **options):
+    """Рассылает mailings в workers процессах, каждый со своим пулом отправки
+    (options - параметры _dispatcher). Журнал доставки должен быть уже
+    заведен. Возвращает сумму по процессам {pk рассылки: число
+    обработанных получателей}. Если хотя бы один процесс упал, после
+    завершения остальных поднимается WorkerError: получатели, забранные
+    упавшим процессом, вернутся в работу по истечении аренды."""
+    mailing_ids = [mailing.pk for mailing in mailings]
+    processed = dict.fromkeys(mailing_ids, 0)
+    if not mailing_ids:
+        return processed
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        workers, mp_context=context, initializer=_init_worker
+    ) as pool:
+        futures = [
+            pool.submit(_send_in_worker, mailing_ids, options) for _ in range(workers)
+        ]
+        errors = []
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Ошибка процесса отправки: {e}")
+                errors.append(e)
+                continue
+            for pk, count in result.items():
+                processed[pk] += count
+    if errors:
+        raise WorkerError(
+            f"Процессов отправки с ошибкой: {len(errors)} из {workers} "
+            f"({errors[0]})",
+            processed,
+        )
+    return processed
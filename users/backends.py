@@ -0,0 +1,71 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Версия кэша прав: растет при любом изменении групп и их прав,
+# после чего все закэшированные наборы прав перестают использоваться
+PERMISSIONS_VERSION_KEY = "perms:version"
+
+
+def _permissions_version():
+    return cache.get_or_set(PERMISSIONS_VERSION_KEY, 1, None)
+
+
+def permissions_cache_key(user_id):
+    return f"perms:{_permissions_version()}:{user_id}"
+
+
+def invalidate_user_permissions(user_id):
+    """Сбрасывает закэшированные права одного пользователя. Недоступный кэш
+    не должен прерывать сохранение пользователя: права лишь устареют до
+    PERMISSIONS_CACHE_TIMEOUT"""
+    try:
+        cache.delete(permissions_cache_key(user_id))
+    except Exception as e:
+        logger.warning(f"Не удалось сбросить кэш прав пользователя {user_id}: {e}")
+
+
+def invalidate_all_permissions():
+    """Сбрасывает закэшированные права всех пользователей"""
+    try:
+        try:
+            cache.incr(PERMISSIONS_VERSION_KEY)
+        except ValueError:
+            # Ключа версии еще нет (или он вытеснен из кэша)
+            cache.set(PERMISSIONS_VERSION_KEY, 2, None)
+    except Exception as e:
+        logger.warning(f"Не удалось сбросить кэш прав: {e}")
+
+
+class CachedPermissionBackend(ModelBackend):
+    """ModelBackend, который хранит набор прав пользователя в кэше (Redis).
+
+    Стандартный бэкенд кэширует права только в объекте пользователя, то есть
+    на один запрос, и в каждом запросе заново читает права пользователя
+    и его групп из БД. Кэш сбрасывается сигналами users.signals при
+    изменении групп, прав и самого пользователя. Если кэш недоступен,
+    права читаются из БД, как в ModelBackend."""
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return super().get_all_permissions(user_obj, obj)
+
+        if not hasattr(user_obj, "_perm_cache"):
+            try:
+                key = permissions_cache_key(user_obj.pk)
+                perms = cache.get(key)
+            except Exception as e:
+                logger.warning(f"Кэш прав недоступен: {e}")
+                return super().get_all_permissions(user_obj, obj)
+            if perms is None:
+                perms = super().get_all_permissions(user_obj)
+                try:
+                    cache.set(key, perms, settings.PERMISSIONS_CACHE_TIMEOUT)
+                except Exception as e:
+                    logger.warning(f"Кэш прав недоступен: {e}")
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
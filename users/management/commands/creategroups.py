@@ -2,7 +2,7 @@ from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core.management.base import BaseCommand
 
-from mailing.models import Mailing, Message, Recipient
+from mailing.models import Mailing, Message, Recipient, Segment
 from users.models import User
 
 
@@ -19,6 +19,7 @@ class Command(BaseCommand):
             "can_view_all_mailings",
             "can_disable_mailings",
             "can_view_all_recipients",
+            "can_view_all_segments",
             "can_view_all_messages",
             "can_view_all_users",
             "can_block_user",
@@ -26,7 +27,7 @@ class Command(BaseCommand):
 
         # Собираем все Content Types
         content_types = ContentType.objects.get_for_models(
-            Mailing, Recipient, Message, User
+            Mailing, Recipient, Segment, Message, User
         )
 
         permissions = []
@@ -0,0 +1,33 @@
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import invalidate_all_permissions, invalidate_user_permissions
+from .models import User
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def permissions_changed(sender, action, **kwargs):
+    # Состав групп и прав меняется редко (например, командой creategroups),
+    # поэтому сбрасываем кэш прав всех пользователей
+    if action in ("post_add", "post_remove", "post_clear"):
+        transaction.on_commit(invalidate_all_permissions)
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def group_deleted(sender, **kwargs):
+    transaction.on_commit(invalidate_all_permissions)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # is_superuser и is_active влияют на набор прав. Вход пользователя
+    # (обновление только last_login) права не меняет
+    if update_fields == {"last_login"}:
+        return
+    transaction.on_commit(lambda: invalidate_user_permissions(instance.pk))
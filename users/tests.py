@@ -1 +1,64 @@
-# Create your tests here.
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from .models import User
+
+PERM = "mailing.can_view_all_mailings"
+
+
+class CachedPermissionBackendTests(TestCase):
+    """Права пользователя читаются из кэша и сбрасываются при изменении
+    групп и прав, а без кэша читаются из БД"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email="manager@example.com")
+
+    def setUp(self):
+        cache.clear()
+
+    def fresh_user(self):
+        # Новый объект: права, запомненные в самом объекте, не используются
+        return User.objects.get(pk=self.user.pk)
+
+    def test_cache_hit_skips_permission_queries(self):
+        self.fresh_user().get_all_permissions()
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertFalse(user.has_perm(PERM))
+
+    def test_group_change_invalidates(self):
+        self.assertFalse(self.fresh_user().has_perm(PERM))
+        group = Group.objects.create(name="Проверка")
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.add(Permission.objects.get(codename=PERM.split(".")[1]))
+            self.user.groups.add(group)
+        self.assertTrue(self.fresh_user().has_perm(PERM))
+
+    def test_creategroups_invalidates(self):
+        self.user.groups.add(Group.objects.create(name="Менеджеры"))
+        self.assertFalse(self.fresh_user().has_perm(PERM))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("creategroups", stdout=StringIO())
+        self.assertTrue(self.fresh_user().has_perm(PERM))
+
+    def test_cache_outage(self):
+        broken = mock.Mock()
+        for method in ("get", "get_or_set", "set", "delete", "incr"):
+            getattr(broken, method).side_effect = ConnectionError("Redis недоступен")
+        group = Group.objects.create(name="Проверка")
+        group.permissions.add(Permission.objects.get(codename=PERM.split(".")[1]))
+        self.user.groups.add(group)
+
+        with mock.patch("users.backends.cache", broken), self.assertLogs(
+            "users.backends", "WARNING"
+        ):
+            self.assertTrue(self.fresh_user().has_perm(PERM))
+            with self.captureOnCommitCallbacks(execute=True):
+                User.objects.create(email="new@example.com")
+                group.permissions.clear()
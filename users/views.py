@@ -51,29 +51,39 @@ class OwnerRequiredMixin:
         return queryset.filter(owner=user)
 
 
-class OwnerOrManagerTestMixin(UserPassesTestMixin):
-    """Миксин для UpdateView, DeleteView. Проверяет, что юзер - владелец, или менеджер."""
+def can_manage_object(user, obj):
+    """Может ли пользователь управлять объектом: владелец или менеджер"""
+    # Суперпользователь всегда может все
+    if user.is_superuser:
+        return True
 
-    def test_func(self):
-        user = self.request.user
-        obj = self.get_object()
+    app_label = obj._meta.app_label
+    model_name = obj._meta.model_name
+
+    # Проверка прав менеджера
+    if model_name == "mailing":
+        # Для рассылки менеджеру достаточно права на отключение (can_disable_mailings)
+        is_manager = user.has_perm(f"{app_label}.can_disable_mailings")
+    else:
+        # Для остальных объектов достаточно права на просмотр всех
+        is_manager = user.has_perm(f"{app_label}.can_view_all_{model_name}s")
 
-        # Суперпользователь всегда может все
-        if user.is_superuser:
-            return True
+    # Проверка владельца (по id, без загрузки владельца из БД)
+    is_owner = obj.owner_id == user.pk
 
-        app_label = obj._meta.app_label
-        model_name = obj._meta.model_name
+    return is_manager or is_owner
 
-        # Проверка прав менеджера
-        if model_name == "mailing":
-            # Для рассылки менеджеру достаточно права на отключение (can_disable_mailings)
-            is_manager = user.has_perm(f"{app_label}.can_disable_mailings")
-        else:
-            # Для остальных объектов достаточно права на просмотр всех
-            is_manager = user.has_perm(f"{app_label}.can_view_all_{model_name}s")
 
-            # Проверка владельца
-        is_owner = obj.owner == user
+class OwnerOrManagerTestMixin(UserPassesTestMixin):
+    """Миксин для UpdateView, DeleteView. Проверяет, что юзер - владелец, или менеджер."""
 
-        return is_manager or is_owner
+    def get_object(self, queryset=None):
+        # Объект нужен и проверке доступа, и самой view - загружаем его один раз
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, "_object"):
+            self._object = super().get_object()
+        return self._object
+
+    def test_func(self):
+        return can_manage_object(self.request.user, self.get_object())